@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # Cache invalidation receivers for stores, token versions and catalogs.
+        from . import authentication, catalog, store_cache  # noqa: F401
+        from .search import install_sqlite_index
+        post_migrate.connect(install_sqlite_index, sender=self)
+        if settings.INSTRUMENTATION:
+            from .instrumentation import install_query_timer
+            connection_created.connect(install_query_timer)
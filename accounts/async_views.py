@@ -0,0 +1,185 @@
+"""Async versions of the read endpoints, served when running under ASGI.
+
+Django runs a sync view under ASGI on a thread of its own, and the thread is
+held for the whole request, database waits included. These views await the
+async ORM on the event loop instead, so one worker keeps many slow reads in
+flight at once. PDF renders stay in the process pool; the PDF endpoint
+awaits the render rather than answering 202 straight away, and the stock
+alert stream waits between polls with ``asyncio.sleep``.
+
+Each view subclasses its sync counterpart in ``accounts.views`` for the
+queryset, serializer and paging setup, and only replaces the handlers.
+accounts/urls.py routes to them when ``SERVING_MODE`` is 'asgi'.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.generics import GenericAPIView
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from . import pdf, views
+from .catalog import acatalog_version, catalog_cache, catalog_etag
+from .instrumentation import span
+from .models import Invoice, Store
+from .search import search_customers
+from .serializers import InvoiceDetailSerializer, StoreSerializer
+
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines.
+
+    Authentication, permission and throttle checks run as they do for a
+    sync view, in one hop to the request's thread, since they may hit the
+    database; the handler then runs on the event loop.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Load the store while still on the thread: for token users it's a
+        # lazy lookup the event loop isn't allowed to make.
+        getattr(request.user, 'store', None)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = self.http_method_not_allowed
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListAPIView(AsyncAPIView, GenericAPIView):
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = None
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
+
+
+class StoreDetailView(AsyncAPIView, views.StoreDetailView):
+    async def get(self, request):
+        store = await Store.objects.aget(user_id=request.user.pk)
+        return Response(StoreSerializer(store).data)
+
+    async def put(self, request):
+        return await sync_to_async(views.StoreDetailView.put)(self, request)
+
+
+class ProductListView(AsyncListAPIView, views.ProductListView):
+    async def alist(self, request, *args, **kwargs):
+        store_id = request.user.store.pk
+        query = request.GET.urlencode()
+        version = await acatalog_version(store_id)
+        etag = catalog_etag(store_id, version, query)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = catalog_cache.get((store_id, query), version)
+        if data is None:
+            data = (await super().alist(request, *args, **kwargs)).data
+            if isinstance(data, dict):
+                data = {**data, 'results': list(data['results'])}
+            else:
+                data = list(data)
+            catalog_cache.put((store_id, query), version, data)
+        return Response(data, headers={'ETag': etag})
+
+
+class CustomerListView(AsyncListAPIView, views.CustomerListView):
+    async def alist(self, request, *args, **kwargs):
+        query = request.GET.get('search', '')
+        if not query.strip():
+            return await super().alist(request, *args, **kwargs)
+        try:
+            limit = max(1, min(int(request.GET.get('limit', self.search_limit)), self.max_search_limit))
+        except ValueError:
+            return Response({'error': "'limit' must be an integer."}, status=400)
+        # Several raw queries on some backends; one hop to the thread for all of them.
+        customers = await sync_to_async(search_customers)(request.user.store, query, limit)
+        return Response(self.get_serializer(customers, many=True).data)
+
+
+class InvoiceListView(AsyncListAPIView, views.InvoiceListView):
+    pass
+
+
+class InvoicePDFView(AsyncAPIView, views.InvoicePDFView):
+    async def get(self, request, pk):
+        invoices = InvoiceDetailSerializer.setup_eager_loading(Invoice.objects.filter(store=request.user.store))
+        invoice = await invoices.filter(pk=pk).afirst()
+        if invoice is None:
+            raise Http404
+        with span('pdf'):
+            html_string = await sync_to_async(render_to_string)('invoice_template.html', {'invoice': invoice})
+            key = pdf.cache_key(html_string)
+
+            path = pdf.lookup(key)
+            if path is None:
+                future = pdf.schedule(key, html_string)
+                try:
+                    # shield(): giving up on the wait must not cancel the render.
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), settings.PDF_RENDER_WAIT_SECONDS)
+                except Exception:
+                    # Still rendering, or the render failed (pdf logs it and the
+                    # next poll queues a fresh one): either way, come back later.
+                    return Response({'status': 'rendering'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '1'})
+                path = pdf.cache_path(key)
+
+        response = HttpResponse(await sync_to_async(path.read_bytes)(), content_type='application/pdf')
+        response['Content-Disposition'] = f'filename="invoice_{pk}.pdf"'
+        response['ETag'] = f'"{key}"'
+        return response
+
+
+class StockAlertStreamView(AsyncAPIView, views.StockAlertStreamView):
+    # Waits between polls on the event loop, so open streams hold no thread
+    # and need no cap.
+    streaming_response = StreamingHttpResponse
+
+    async def get(self, request):
+        return super().get(request)
+
+    async def events(self, store, since):
+        poll = settings.STOCK_ALERT_POLL_SECONDS
+        deadline = time.monotonic() + settings.STOCK_ALERT_STREAM_SECONDS
+        encoder = JSONEncoder()
+        yield f'retry: {int(poll * 1000)}\n\n'
+        while True:
+            alerts = [alert async for alert in views.stock_alerts_after(store, since)[:self.batch_size]]
+            for alert in alerts:
+                yield views.alert_event(encoder, alert)
+                since = alert.pk
+            if len(alerts) == self.batch_size:
+                continue
+            if time.monotonic() >= deadline:
+                return
+            yield ': keep-alive\n\n'
+            await sync_to_async(views.release_connection)()
+            await asyncio.sleep(poll)
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+
+from .models import Store, User
+from .store_cache import attach_store, store_cache
+
+
+class StoreJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that also resolves the user's store from the worker cache."""
+
+    def get_user(self, validated_token):
+        return attach_store(super().get_user(validated_token))
+
+
+class StoreTokenUser(TokenUser):
+    """User built from a StoreRefreshToken's claims instead of the User table."""
+
+    @property
+    def store_id(self):
+        return self.token.get('store_id')
+
+    @property
+    def is_active_subscriber(self):
+        return self.token.get('is_active_subscriber', False)
+
+    @cached_property
+    def subscription_end(self):
+        value = self.token.get('subscription_end')
+        return parse_date(value) if value else None
+
+    @cached_property
+    def store(self):
+        # The token names the store, so it needs no lookup: only its pk is
+        # loaded, and any other field on first access. A store created after
+        # the token was issued is found through the worker cache instead.
+        store_id = self.token.get('store_id')
+        if store_id is not None:
+            return Store.from_db(None, ['id'], [store_id])
+        try:
+            return store_cache.get(self.pk)
+        except Store.DoesNotExist:
+            raise User.store.RelatedObjectDoesNotExist('User has no store.')
+
+    def __getattr__(self, attr):
+        # An AttributeError from a property lands here, and TokenUser answers
+        # unknown attributes from the claims, which would make a missing store
+        # None. Raise what User.store raises instead, so hasattr() and
+        # getattr(user, 'store', None) behave as they do for a database user.
+        if attr == 'store':
+            raise User.store.RelatedObjectDoesNotExist('User has no store.')
+        return super().__getattr__(attr)
+
+
+class StatelessStoreJWTAuthentication(JWTStatelessUserAuthentication):
+    """Authenticates from signed claims alone.
+
+    The only lookup is the user's current ``token_version``, served from the
+    Django cache and read from the database only after it changes or expires.
+    With a shared cache backend a revocation is seen by every worker at once;
+    with the default local-memory cache it takes up to
+    ``TOKEN_VERSION_CACHE_TTL`` seconds to reach other workers.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if validated_token.get('ver') != token_version(user.pk):
+            raise InvalidToken('Token has been revoked.')
+        return user
+
+
+def token_version_key(user_id):
+    return f'accounts:token-version:{user_id}'
+
+
+def token_version(user_id):
+    """Current ``User.token_version``, or None if the user no longer exists."""
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+        cache.set(key, -1 if version is None else version, settings.TOKEN_VERSION_CACHE_TTL)
+    return None if version == -1 else version
+
+
+@receiver(post_save, sender=User)
+def cache_token_version(sender, instance, **kwargs):
+    cache.set(token_version_key(instance.pk), instance.token_version, settings.TOKEN_VERSION_CACHE_TTL)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user(sender, instance, **kwargs):
+    cache.set(token_version_key(instance.pk), -1, settings.TOKEN_VERSION_CACHE_TTL)
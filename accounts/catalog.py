@@ -0,0 +1,167 @@
+"""Per-store product catalog versioning and a per-worker catalog cache.
+
+``Store.catalog_version`` changes on every product write: product saves and
+deletes move it through ``Store.allocate_change_seq(..., catalog=True)``,
+and checkout does the same before it takes stock.
+
+ProductListView derives its ETag from the version, so a terminal whose
+catalog hasn't changed gets a 304 without any serialization. The version is
+read from the database unless ``CATALOG_VERSION_CACHE_TTL`` is set; only do
+that with a shared cache backend, since a bump clears the cached value only
+in the cache it can reach.
+
+``resolve_skus`` maps scanned barcodes to product ids through a per-worker
+LRU of hot SKUs. An entry can outlive a rename or delete made in another
+worker, so checkout re-checks the SKU on the product rows it locks.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, Store
+
+
+def version_key(store_id):
+    return f'accounts:catalog-version:{store_id}'
+
+
+def catalog_version(store_id):
+    ttl = settings.CATALOG_VERSION_CACHE_TTL
+    if ttl:
+        version = cache.get(version_key(store_id))
+        if version is not None:
+            return version
+    version = Store.objects.filter(pk=store_id).values_list('catalog_version', flat=True).first()
+    if ttl and version is not None:
+        cache.set(version_key(store_id), version, ttl)
+    return version
+
+
+async def acatalog_version(store_id):
+    """``catalog_version`` for async views."""
+    ttl = settings.CATALOG_VERSION_CACHE_TTL
+    if ttl:
+        version = await cache.aget(version_key(store_id))
+        if version is not None:
+            return version
+    version = await Store.objects.filter(pk=store_id).values_list('catalog_version', flat=True).afirst()
+    if ttl and version is not None:
+        await cache.aset(version_key(store_id), version, ttl)
+    return version
+
+
+def catalog_etag(store_id, version, query_string):
+    # Different ?fields= / paging params are different representations.
+    variant = hashlib.md5(query_string.encode(), usedforsecurity=False).hexdigest()[:12]
+    return f'"catalog-{store_id}-{version}-{variant}"'
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    forget_catalog_version(instance.store_id)
+    sku_cache.forget_product(instance.pk)
+
+
+def forget_catalog_version(store_id):
+    # The version itself was bumped in the writing transaction; drop the
+    # cached copy once that commits.
+    transaction.on_commit(lambda: cache.delete(version_key(store_id)))
+
+
+class CatalogCache:
+    """Bounded LRU of serialized catalogs keyed by (store, query), tagged with a version."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, data):
+        with self._lock:
+            self._entries[key] = (version, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_cache = CatalogCache(settings.CATALOG_CACHE_SIZE)
+
+
+class SkuCache:
+    """Bounded LRU of (store, sku) -> product id, with entries expiring after ``ttl`` seconds."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, store_id, sku):
+        key = (store_id, sku)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, store_id, sku, product_id):
+        key = (store_id, sku)
+        with self._lock:
+            self._entries[key] = (product_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def forget_product(self, product_id):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == product_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+sku_cache = SkuCache(settings.SKU_CACHE_SIZE, settings.SKU_CACHE_TTL)
+
+
+def resolve_skus(store_id, skus):
+    """Map each of ``skus`` to the id of ``store_id``'s product carrying it.
+
+    Unknown SKUs are left out. Costs one query for the SKUs that aren't hot,
+    and none when they all are.
+    """
+    found = {}
+    missing = []
+    for sku in set(skus):
+        product_id = sku_cache.get(store_id, sku)
+        if product_id is None:
+            missing.append(sku)
+        else:
+            found[sku] = product_id
+    if missing:
+        for product_id, sku in Product.objects.filter(store_id=store_id, sku__in=missing).values_list('pk', 'sku'):
+            found[sku] = product_id
+            sku_cache.put(store_id, sku, product_id)
+    return found
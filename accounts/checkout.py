@@ -0,0 +1,226 @@
+"""Writing invoices: stock check, stock movement and the invoice rows.
+
+``place_invoices`` takes a group of already-validated orders and writes them
+in one transaction: the store row is locked first, then every product the
+group touches in primary key order, and stock for the whole group is taken in
+one guarded UPDATE. Products that the group takes down to their reorder level
+get a StockAlert, and the daily sales rollups are updated, in the same
+transaction. The single-invoice endpoint is a group of one; bulk ingestion
+from an offline till sends larger groups.
+"""
+import random
+import time
+
+from django.db import OperationalError, models, transaction
+from django.db.models import Case, F, Q, When
+from rest_framework.exceptions import ValidationError
+
+from .catalog import forget_catalog_version, sku_cache
+from .models import Customer, Invoice, InvoiceItem, Product, StockAlert, Store
+from .rollups import gst_on, record_sales
+
+
+# Checkout retries on these failures instead of surfacing a 500 to the till:
+# serialization failure, deadlock and lock timeout on Postgres, and SQLite's
+# "database is locked" / "database table is locked".
+CHECKOUT_ATTEMPTS = 5
+CHECKOUT_LOCK_TIMEOUT = '5s'
+RETRYABLE_SQLSTATES = {'40001', '40P01', '55P03'}
+
+CREATED = 'created'
+REPLAYED = 'replayed'
+REJECTED = 'rejected'
+
+
+def is_retryable(exc):
+    # psycopg 3 errors carry the SQLSTATE as .sqlstate, psycopg2's as .pgcode.
+    cause = exc.__cause__
+    sqlstate = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    if sqlstate:
+        return sqlstate in RETRYABLE_SQLSTATES
+    return 'locked' in str(exc)
+
+
+def with_retries(func, *args):
+    # Retrying only makes sense when we own the transaction; inside an
+    # outer atomic block the caller has to deal with the failure.
+    attempts = 1 if transaction.get_connection().in_atomic_block else CHECKOUT_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args)
+        except OperationalError as exc:
+            if attempt == attempts or not is_retryable(exc):
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+
+def place_invoices(store, orders):
+    """Write ``orders`` for ``store`` in one transaction.
+
+    Each order is a validated dict with ``items`` (``product``/``quantity``,
+    plus the ``sku`` the product was resolved from, if any), ``customer`` or
+    ``new_customer``, and optionally ``gst_percentage`` and ``idempotency_key``.
+    Returns one ``(status, result)`` pair per order: ``(CREATED, invoice)``,
+    ``(REPLAYED, invoice)`` for a key the store has already used, or
+    ``(REJECTED, message)`` when a product is gone or short of stock. A
+    rejected order writes nothing; the rest of the group still goes in.
+    """
+    keys = {order['idempotency_key'] for order in orders if order.get('idempotency_key')}
+    product_ids = {item['product'].pk for order in orders for item in order['items']}
+
+    with transaction.atomic():
+        connection = transaction.get_connection()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{CHECKOUT_LOCK_TIMEOUT}'")
+
+        # Store row first, then products: the same order a product save
+        # takes them in, so the two can't deadlock. Holding the store row
+        # also serialises this store's uploads, so the replay check below
+        # can't race another request carrying the same key. The bills
+        # snapshot the store as it is now, not as this worker's cached copy
+        # last saw it.
+        seller = (
+            Store.objects.select_for_update().filter(pk=store.pk)
+            .values(*Invoice.STORE_SNAPSHOT.values()).get()
+        )
+        snapshot = {field: seller[source] for field, source in Invoice.STORE_SNAPSHOT.items()}
+
+        seen = {}
+        if keys:
+            seen = {
+                invoice.idempotency_key: invoice
+                for invoice in Invoice.objects.filter(store=store, idempotency_key__in=keys)
+            }
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(store=store, pk__in=product_ids).order_by('pk')
+        }
+        stock = {pk: product.stock for pk, product in products.items()}
+
+        results = []
+        taken = {}
+        placed = []
+        for order in orders:
+            key = order.get('idempotency_key')
+            if key and key in seen:
+                results.append((REPLAYED, seen[key]))
+                continue
+
+            # A product deleted since validation, or a SKU resolved from a
+            # cache entry that went stale in this worker, bills nothing.
+            unknown = []
+            for item in order['items']:
+                product = products.get(item['product'].pk)
+                if product is None or (item.get('sku') and product.sku != item['sku']):
+                    unknown.append(str(item.get('sku') or item['product'].pk))
+                    sku_cache.forget_product(item['product'].pk)
+            if unknown:
+                results.append((REJECTED, f"Unknown product {', '.join(sorted(unknown))}"))
+                continue
+
+            # Same product may appear on several lines; stock is checked per product.
+            quantities = {}
+            for item in order['items']:
+                pk = item['product'].pk
+                quantities[pk] = quantities.get(pk, 0) + item['quantity']
+            short = [products[pk].name for pk, quantity in quantities.items() if stock[pk] < quantity]
+            if short:
+                results.append((REJECTED, f"Not enough stock for {', '.join(sorted(short))}"))
+                continue
+            for pk, quantity in quantities.items():
+                stock[pk] -= quantity
+                taken[pk] = taken.get(pk, 0) + quantity
+
+            gst_percentage = order.get('gst_percentage', 18)
+            subtotal = sum(products[item['product'].pk].price * item['quantity'] for item in order['items'])
+            gst_amount = gst_on(subtotal, gst_percentage)
+
+            if order.get('new_customer'):
+                customer = Customer.objects.create(store=store, **order['new_customer'])
+            else:
+                customer = order['customer']
+
+            invoice = Invoice(
+                store=store,
+                customer=customer,
+                gst_percentage=gst_percentage,
+                subtotal=subtotal,
+                gst_amount=gst_amount,
+                total=subtotal + gst_amount,
+                idempotency_key=key or None,
+                item_count=len(order['items']),
+                customer_name=customer.name,
+                **snapshot,
+            )
+            placed.append((invoice, order['items']))
+            results.append((CREATED, invoice))
+            if key:
+                seen[key] = invoice
+
+        if not placed:
+            return results
+
+        Invoice.objects.bulk_create([invoice for invoice, _ in placed])
+        if taken:
+            # Only now that stock really moves: a group that was all replays
+            # and rejections leaves every till's catalog current.
+            change_seq = Store.allocate_change_seq(store.pk, catalog=True)
+            decrement_stock(products, taken, change_seq)
+            forget_catalog_version(store.pk)
+            raise_stock_alerts(store, products, stock, taken)
+
+        lines = InvoiceItem.objects.bulk_create([
+            InvoiceItem(
+                invoice=invoice,
+                product=products[item['product'].pk],
+                quantity=item['quantity'],
+                price=products[item['product'].pk].price
+            )
+            for invoice, items in placed
+            for item in items
+        ])
+        record_sales(store.pk, [invoice for invoice, _ in placed], lines)
+
+    return results
+
+
+def decrement_stock(products, quantities, change_seq):
+    """Take stock for every product in one guarded UPDATE.
+
+    Each row is only touched while ``stock >= quantity`` still holds. The
+    rows are already locked on Postgres; on SQLite, which has no row locks,
+    the guard is what stops an oversell, and a short row count rolls the
+    whole group back.
+    """
+    guard = Q()
+    for pk, quantity in quantities.items():
+        guard |= Q(pk=pk, stock__gte=quantity)
+    updated = Product.objects.filter(guard).update(
+        stock=Case(
+            *[When(pk=pk, then=F('stock') - quantity) for pk, quantity in quantities.items()],
+            default=F('stock'),
+            output_field=models.PositiveIntegerField()
+        ),
+        change_seq=change_seq
+    )
+    if updated != len(quantities):
+        names = ', '.join(sorted(products[pk].name for pk in quantities))
+        raise ValidationError(f"Not enough stock for {names}")
+
+
+def raise_stock_alerts(store, products, stock, taken):
+    """Alert on every product in ``taken`` whose stock fell to its reorder level.
+
+    ``products`` still hold the stock read under the row lock and ``stock``
+    the stock after this group, so this needs no query of its own. Only the
+    sale that crosses the level alerts; later sales of a product that is
+    already low don't repeat it.
+    """
+    alerts = []
+    for pk in taken:
+        product = products[pk]
+        if product.reorder_level is not None and stock[pk] <= product.reorder_level < product.stock:
+            alerts.append(StockAlert(store=store, product=product, stock=stock[pk], reorder_level=product.reorder_level))
+    if alerts:
+        StockAlert.objects.bulk_create(alerts)
@@ -0,0 +1,83 @@
+"""GST return summaries, aggregated in SQL.
+
+``gst_summary`` groups a store's invoices over a date range by GST rate, by
+day or by customer (from the invoice totals), or by product and rate (from
+the invoice lines), and the database does the grouping and summing: only
+one row per group comes back, however many invoices the period holds.
+``csv_rows`` turns a summary into CSV lines for streaming.
+"""
+import csv
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Round, TruncDate
+
+from .models import Invoice, InvoiceItem
+
+PAISA = Decimal('0.01')
+
+# Column order of each summary, as written to CSV.
+COLUMNS = {
+    'rate': ['rate', 'invoices', 'taxable_value', 'gst_amount', 'total'],
+    'day': ['day', 'invoices', 'taxable_value', 'gst_amount', 'total'],
+    'customer': ['customer', 'customer_name', 'invoices', 'taxable_value', 'gst_amount', 'total'],
+    'product': ['product', 'product_name', 'rate', 'quantity', 'taxable_value', 'gst_amount'],
+}
+
+
+def gst_summary(store, start, end, group_by):
+    """Rows of ``COLUMNS[group_by]`` for ``store``'s invoices from ``start`` to ``end``."""
+    invoices = Invoice.objects.filter(store=store).created_between(start, end)
+
+    if group_by == 'product':
+        money = DecimalField(max_digits=14, decimal_places=2)
+        taxable = ExpressionWrapper(F('price') * F('quantity'), output_field=money)
+        return (
+            InvoiceItem.objects.filter(invoice__in=invoices.values('pk'))
+            .values('product', product_name=F('product__name'), rate=F('invoice__gst_percentage'))
+            .annotate(
+                taxable_value=Sum(taxable),
+                # Each line's GST rounded to the paisa, as in the sales rollups.
+                gst_amount=Sum(Round(taxable * F('invoice__gst_percentage') / 100, 2), output_field=money),
+                quantity=Sum('quantity'),
+            )
+            .order_by('product', 'rate')
+        )
+
+    if group_by == 'rate':
+        groups = invoices.values(rate=F('gst_percentage'))
+    elif group_by == 'day':
+        groups = invoices.values(day=TruncDate('created_at'))
+    elif group_by == 'customer':
+        # Under the name on the bills, as filed; no join to customers.
+        groups = invoices.values('customer', 'customer_name')
+    else:
+        raise ValueError(f"Unknown GST summary grouping {group_by!r}.")
+    return groups.annotate(
+        invoices=Count('id'),
+        taxable_value=Sum('subtotal'),
+        gst_amount=Sum('gst_amount'),
+        total=Sum('total'),
+    ).order_by(COLUMNS[group_by][0])
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_rows(rows, group_by):
+    """Yield the CSV header and then one line per summary row."""
+    columns = COLUMNS[group_by]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([cell(row[column]) for column in columns])
+
+
+def cell(value):
+    # Money as a two-place string, as the serializers render it; SQLite hands
+    # sums of decimal columns back unrounded.
+    if isinstance(value, Decimal):
+        return str(value.quantize(PAISA))
+    return value
@@ -0,0 +1,390 @@
+"""Per-request timings: Server-Timing headers and Prometheus metrics.
+
+``InstrumentationMiddleware`` gives each request a ``Stats`` in a context
+variable. Queries are timed by an execute wrapper on every database
+connection, serializer ``.data`` and PDF rendering by ``span()``, and the
+totals go out as a ``Server-Timing`` header and into per-endpoint histograms
+served in the Prometheus text format by ``metrics_view``. A statement run
+``INSTRUMENTATION_N_PLUS_ONE`` times or more in one request is logged and
+counted as an N+1.
+
+The context variable follows a request into ``sync_to_async`` threads, so
+async views are measured the same way. Queries run while a streaming
+response is being sent are not counted.
+
+Each process keeps its own metrics. With ``METRICS_DIR`` set, a thread in
+each process also writes them there every few seconds and ``/metrics`` adds
+up every file in it, so one scrape covers all the workers of a server. When
+a worker exits, gunicorn's master folds its file into ``exited.json`` with
+``fold_exited``, so the directory holds one file per live worker however
+often workers are recycled, and counters never go backwards.
+"""
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+METRICS_FLUSH_SECONDS = 5
+# Totals of the workers that have exited, in METRICS_DIR.
+EXITED_FILE = 'exited.json'
+FOLDED_HISTORY = 100
+# Anything else a client sends is labelled 'other', to bound the series.
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Stats:
+    """What one request spent, filled in as it runs."""
+    __slots__ = ('db_time', 'statements', 'spans', 'depth')
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.statements = {}
+        self.spans = {}
+        self.depth = {}
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.statements[sql] = stats.statements.get(sql, 0) + 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # Receiver for connection_created; see AccountsConfig.ready.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the current request's ``name`` timing.
+
+    Queries inside the block count as database time, not as ``name``, and a
+    span nested in one of the same name is not counted twice.
+    """
+    stats = _current.get()
+    if stats is None or stats.depth.get(name):
+        yield
+        return
+    stats.depth[name] = 1
+    db_time = stats.db_time
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (stats.db_time - db_time)
+        stats.spans[name] = stats.spans.get(name, 0.0) + elapsed
+        stats.depth[name] = 0
+
+
+def time_serializers():
+    # Serializer.data and ListSerializer.data both go through
+    # BaseSerializer.data, so wrapping it once times every top-level
+    # serialization; nested serializers only call to_representation.
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, 'instrumented', False):
+        return
+
+    @functools.wraps(data.fget)
+    def timed(self):
+        with span('serialize'):
+            return data.fget(self)
+
+    timed.instrumented = True
+    BaseSerializer.data = property(timed)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def exposition(self, series):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, row in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], row):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{labels}}} {row[-1]:.6f}'
+            yield f'{self.name}_count{{{labels}}} {cumulative}'
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+
+    def inc(self, labels):
+        self.series[labels] = self.series.get(labels, 0) + 1
+
+    def exposition(self, series):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(series.items()):
+            yield f'{self.name}{{{labels}}} {value}'
+
+
+class Registry:
+    """This process's metrics, keyed by their rendered label string."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter('billing_requests_total', 'Requests by endpoint, method and status.')
+        self.n_plus_one = Counter('billing_n_plus_one_total', 'Requests that repeated one statement too often.')
+        self.duration = Histogram('billing_request_seconds', 'Time to produce the response.', TIME_BUCKETS)
+        self.db = Histogram('billing_request_db_seconds', 'Time spent in database queries.', TIME_BUCKETS)
+        self.queries = Histogram('billing_request_queries', 'Database queries per request.', QUERY_BUCKETS)
+        self.serialize = Histogram('billing_request_serialize_seconds', 'Time spent serializing.', TIME_BUCKETS)
+        self.pdf = Histogram('billing_request_pdf_seconds', 'Time spent on invoice PDFs.', TIME_BUCKETS)
+        self.metrics = [self.requests, self.n_plus_one, self.duration, self.db, self.queries, self.serialize, self.pdf]
+        self.flusher = None
+        self.process = None
+
+    def record(self, endpoint, method, status, total, stats, repeated):
+        labels = f'endpoint="{escape(endpoint)}",method="{method}"'
+        with self.lock:
+            self.requests.inc(f'{labels},status="{status}"')
+            self.duration.observe(labels, total)
+            self.db.observe(labels, stats.db_time)
+            self.queries.observe(labels, stats.queries)
+            if 'serialize' in stats.spans:
+                self.serialize.observe(labels, stats.spans['serialize'])
+            if 'pdf' in stats.spans:
+                self.pdf.observe(labels, stats.spans['pdf'])
+            if repeated:
+                self.n_plus_one.inc(labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {metric.name: {labels: list(row) if isinstance(row, list) else row
+                                  for labels, row in metric.series.items()}
+                    for metric in self.metrics}
+
+    def start_flushing(self, directory):
+        # One thread per process, started in the worker itself: threads
+        # don't survive the fork from a preloading master.
+        if self.flusher is not None and self.flusher[0] == os.getpid():
+            return
+        thread = threading.Thread(target=self.flush_every, args=(directory,), daemon=True)
+        self.flusher = (os.getpid(), thread)
+        thread.start()
+
+    def flush_every(self, directory):
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            self.flush(directory)
+
+    def process_name(self):
+        # "<pid>-<random>": unique even when a PID comes round again, and
+        # new in a forked child.
+        pid = os.getpid()
+        if self.process is None or self.process[0] != pid:
+            self.process = (pid, f'{pid}-{uuid.uuid4().hex[:12]}')
+        return self.process[1]
+
+    def flush(self, directory):
+        name = self.process_name()
+        write_json(Path(directory) / f'{name}.json', {'process': name, 'metrics': self.snapshot()})
+
+    def exposition(self, snapshots):
+        merged = merge(snapshots)
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.exposition(merged.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def merge(snapshots):
+    """Add up registry snapshots: counters and histogram rows, per label set."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            total = merged.setdefault(name, {})
+            for labels, value in series.items():
+                if isinstance(value, list):
+                    previous = total.get(labels)
+                    total[labels] = value if previous is None else [a + b for a, b in zip(previous, value)]
+                else:
+                    total[labels] = total.get(labels, 0) + value
+    return merged
+
+
+def write_json(path, data):
+    # Atomically replace the file; readers never see half of one.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        # Replaced or removed since the directory was listed.
+        return None
+
+
+def read_snapshots(directory):
+    """The metrics of every process in ``directory``, exited ones included."""
+    # Live files first: one folded away meanwhile is then in the total read
+    # after, and listed as folded so it isn't counted twice.
+    files = [data for data in map(read_json, Path(directory).glob('*-*.json')) if data is not None]
+    exited = read_json(Path(directory) / EXITED_FILE) or {'folded': [], 'metrics': {}}
+    folded = set(exited['folded'])
+    return [exited['metrics'], *(data['metrics'] for data in files if data['process'] not in folded)]
+
+
+def fold_exited(directory, pid):
+    """Add the metrics of exited process ``pid`` to ``EXITED_FILE`` and delete its file.
+
+    Only one process may fold into a directory; gunicorn.conf.py does it in
+    the master, from child_exit.
+    """
+    paths = list(Path(directory).glob(f'{pid}-*.json'))
+    files = [data for data in map(read_json, paths) if data is not None]
+    if not files:
+        return
+    exited = read_json(Path(directory) / EXITED_FILE) or {'folded': [], 'metrics': {}}
+    write_json(Path(directory) / EXITED_FILE, {
+        # Recent enough to cover any scrape still reading the files.
+        'folded': [*exited['folded'], *(data['process'] for data in files)][-FOLDED_HISTORY:],
+        'metrics': merge([exited['metrics'], *(data['metrics'] for data in files)]),
+    })
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+registry = Registry()
+
+
+class InstrumentationMiddleware:
+    """Measures each request; first in MIDDLEWARE so it sees all of it."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.n_plus_one = settings.INSTRUMENTATION_N_PLUS_ONE
+        self.directory = settings.METRICS_DIR
+        self.started = False
+
+    def start(self):
+        # On the first request: DRF isn't imported at boot, and the flush
+        # thread has to start in the worker, after any fork.
+        time_serializers()
+        if self.directory:
+            registry.start_flushing(self.directory)
+        self.started = True
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.started:
+            self.start()
+        stats = Stats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.started:
+            self.start()
+        stats = Stats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    def finish(self, request, response, stats, total):
+        match = request.resolver_match
+        endpoint = (match.view_name or match.route) if match else 'unmatched'
+
+        repeated = None
+        if stats.statements:
+            sql, count = max(stats.statements.items(), key=lambda item: item[1])
+            if count >= self.n_plus_one:
+                repeated = count
+                logger.warning('Possible N+1 in %s: %d runs of %s', endpoint, count, sql[:300])
+
+        timings = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries'
+            f'{f", N+1 x{repeated}" if repeated else ""}"',
+        ]
+        timings += [f'{name};dur={elapsed * 1000:.1f}' for name, elapsed in stats.spans.items()]
+        response['Server-Timing'] = ', '.join(timings)
+
+        method = request.method if request.method in METHODS else 'other'
+        registry.record(endpoint, method, response.status_code, total, stats, repeated)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus metrics for this server, to clients in METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    directory = settings.METRICS_DIR
+    if directory:
+        registry.flush(directory)
+        snapshots = read_snapshots(directory)
+    else:
+        snapshots = [registry.snapshot()]
+    return HttpResponse(registry.exposition(snapshots), content_type='text/plain; version=0.0.4; charset=utf-8')
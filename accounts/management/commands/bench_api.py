@@ -0,0 +1,317 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import Customer, Invoice
+from accounts.tokens import StoreRefreshToken
+
+from .bench_customer_search import make_name
+from .seed_bench import QUANTITIES, WALK_IN_SHARE, clear, pick, seed_store, zipf_weights
+
+
+# Share of till traffic per endpoint: mostly billing, with the catalogue
+# poll, customer lookups, the day's bills and the odd reprint in between.
+MIX = {
+    'create_invoice': 40,
+    'product_list': 20,
+    'customer_search': 10,
+    'customer_list': 5,
+    'invoice_list': 20,
+    'invoice_pdf': 5,
+}
+# Options that shape the workload; a baseline only compares against a run
+# with the same ones.
+WORKLOAD = ('stores', 'products', 'customers', 'invoices', 'requests', 'clients', 'warmup', 'seed')
+# Bills rung up per till request, by number of lines.
+TILL_LINES = {1: 35, 2: 25, 3: 15, 4: 10, 5: 7, 8: 5, 12: 3}
+NEW_CUSTOMER_SHARE = 0.05
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay till traffic against the billing API and compare it with a recorded baseline. "
+        "Seeds benchmark stores (see seed_bench) into a fresh temporary SQLite database, or "
+        "into --database-url, then clients post invoices and read the product list, customer "
+        "list, invoice list and invoice PDFs in realistic proportions. Reports p50/p95/p99 "
+        "latency, throughput and queries per request for each endpoint, and fails if p95 "
+        "latency or throughput regressed by more than the tolerance, if any endpoint runs "
+        "more queries than recorded, or if any request failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=3)
+        parser.add_argument('--products', type=int, default=500, help='Per store.')
+        parser.add_argument('--customers', type=int, default=2000, help='Per store.')
+        parser.add_argument('--invoices', type=int, default=5000, help='Seeded per store.')
+        parser.add_argument('--requests', type=int, default=3000, help='Measured requests, over all clients.')
+        parser.add_argument('--clients', type=int, default=4, help='Tills sending requests at once.')
+        parser.add_argument('--warmup', type=int, default=200, help='Requests sent first and not measured.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database-url',
+                            help='Migrated database to run against instead of a temporary SQLite one; '
+                                 'the benchmark stores are deleted afterwards.')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'api.json'))
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown and throughput drop, as a fraction.')
+        parser.add_argument('--update', action='store_true', help='Record these results as the new baseline.')
+        # Set on the subprocess that seeds and drives one run: where to write
+        # its results. Not stdout, which the PDF render workers share.
+        parser.add_argument('--run', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['run']:
+            Path(options['run']).write_text(json.dumps(self.drive(options)))
+            return
+
+        workload = {name: options[name] for name in WORKLOAD}
+        baseline_path = Path(options['baseline'])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+        if baseline is not None and not options['update'] and baseline['workload'] != workload:
+            raise CommandError(
+                f"{baseline_path} was recorded with {baseline['workload']}; run with the same "
+                f"options or record a new baseline with --update."
+            )
+
+        result = self.run(options)
+        self.report(result, baseline)
+        if options['update']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'workload': workload,
+                'database': result['database'],
+                'python': '.'.join(map(str, sys.version_info[:3])),
+                'cpus': os.cpu_count(),
+                'endpoints': result['endpoints'],
+                'total': result['total'],
+            }, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Baseline written to {baseline_path}')
+            return
+
+        failures = self.compare(result, baseline, options['tolerance'])
+        if failures:
+            raise CommandError('API benchmark regressed:\n' + '\n'.join(failures))
+
+    def run(self, options):
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'result.json'
+            command = [sys.executable, 'manage.py', 'bench_api', '--run', str(output)]
+            for name in WORKLOAD:
+                command += [f'--{name}', str(options[name])]
+            url = options['database_url'] or f"sqlite:///{Path(directory) / 'db.sqlite3'}"
+            # A cold PDF cache of its own, so reprints time the render hand-off.
+            env = {**os.environ, 'DATABASE_URL': url, 'INVOICE_PDF_CACHE_DIR': str(Path(directory) / 'pdf')}
+            result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+            if result.returncode:
+                raise CommandError(f'Benchmark run failed:\n{result.stderr}')
+            return json.loads(output.read_text())
+
+    def report(self, result, baseline):
+        recorded = baseline['endpoints'] if baseline else {}
+        self.stdout.write(
+            f"{result['total']['requests']} requests from {result['clients']} clients on {result['database']}"
+        )
+        self.stdout.write(
+            f"{'endpoint':<16}{'requests':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'queries':>9}{'max':>5}{'errors':>8}{'base p95':>10}{'base q':>8}"
+        )
+        for name, row in [*result['endpoints'].items(), ('total', result['total'])]:
+            base = recorded.get(name) or (baseline['total'] if baseline and name == 'total' else {})
+            self.stdout.write(
+                f"{name:<16}{row['requests']:>9}{row['rate']:>8.1f}{row['p50']:>9.1f}{row['p95']:>9.1f}"
+                f"{row['p99']:>9.1f}{row.get('queries', ''):>9}{row.get('queries_max', ''):>5}{row['errors']:>8}"
+                f"{base.get('p95', '-'):>10}{base.get('queries', '-'):>8}"
+            )
+
+    def compare(self, result, baseline, tolerance):
+        failures = [
+            f"{name}: {row['errors']} failed requests"
+            for name, row in result['endpoints'].items() if row['errors']
+        ]
+        if baseline is None:
+            return failures
+        for name, row in result['endpoints'].items():
+            base = baseline['endpoints'].get(name)
+            if base is None:
+                continue
+            if row['p95'] > base['p95'] * (1 + tolerance):
+                failures.append(f"{name}: p95 {row['p95']:.1f} ms, over {base['p95']:.1f} ms +{tolerance:.0%}")
+            if row['queries'] > base['queries']:
+                failures.append(f"{name}: {row['queries']} queries per request, up from {base['queries']}")
+        rate, base_rate = result['total']['rate'], baseline['total']['rate']
+        if rate < base_rate * (1 - tolerance):
+            failures.append(f"throughput {rate:.1f} req/s, under {base_rate:.1f} req/s -{tolerance:.0%}")
+        return failures
+
+    def drive(self, options):
+        if connection.vendor == 'sqlite':
+            call_command('migrate', verbosity=0)
+        rng = random.Random(options['seed'])
+        clear()
+        try:
+            tills = self.tills(rng, options)
+            connection.close()
+            records = self.load(tills, options)
+        finally:
+            clear()
+        return {
+            'database': connection.vendor,
+            'clients': options['clients'],
+            'endpoints': {name: self.summarise(records[name], records['elapsed']) for name in MIX},
+            'total': self.summarise([row for name in MIX for row in records[name]], records['elapsed']),
+        }
+
+    def tills(self, rng, options):
+        # One Till per client, spread over the seeded stores.
+        stores = []
+        for index in range(options['stores']):
+            store, product_ids, customer_ids = seed_store(
+                index, rng, options['products'], options['customers'], options['invoices'],
+            )
+            token = str(StoreRefreshToken.for_user(store.user).access_token)
+            names = list(Customer.objects.filter(store=store).values_list('name', flat=True))
+            invoice_ids = list(Invoice.objects.filter(store=store).order_by('-created_at', '-id').values_list('pk', flat=True))
+            stores.append((token, product_ids, customer_ids, names, invoice_ids))
+
+        clients = options['clients']
+        tills = []
+        for index in range(clients):
+            token, product_ids, customer_ids, names, invoice_ids = stores[index % len(stores)]
+            # Tills of one store reprint disjoint bills, so every reprint is a
+            # cache miss rather than a wait on another till's render.
+            sharing = range(index % len(stores), clients, len(stores))
+            reprints = invoice_ids[sharing.index(index)::len(sharing)]
+            tills.append(Till(random.Random(rng.random()), token, product_ids, customer_ids, names, reprints))
+        return tills
+
+    def load(self, tills, options):
+        records = {name: [] for name in MIX}
+        issued = iter(range(-options['warmup'], options['requests']))
+        lock = threading.Lock()
+        started = {}
+        crashed = []
+
+        def client(till):
+            try:
+                while True:
+                    with lock:
+                        index = next(issued, None)
+                        if index == 0:
+                            started['at'] = time.perf_counter()
+                    if index is None:
+                        break
+                    name = till.next_endpoint()
+                    begun = time.perf_counter()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = getattr(till, name)()
+                    elapsed = (time.perf_counter() - begun) * 1000
+                    if index >= 0:
+                        with lock:
+                            records[name].append((elapsed, len(queries), response.status_code >= 400))
+            except Exception as exc:
+                # A dead till would quietly shrink the sample.
+                crashed.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(till,)) for till in tills]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if crashed:
+            raise crashed[0]
+        records['elapsed'] = time.perf_counter() - started.get('at', time.perf_counter())
+        return records
+
+    def summarise(self, rows, elapsed):
+        if not rows:
+            return {'requests': 0, 'rate': 0, 'p50': 0, 'p95': 0, 'p99': 0, 'queries': 0, 'queries_max': 0, 'errors': 0}
+        timings = [row[0] for row in rows]
+        queries = [row[1] for row in rows]
+        cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        return {
+            'requests': len(rows),
+            'rate': round(len(rows) / elapsed, 1),
+            'p50': round(cuts[49], 1), 'p95': round(cuts[94], 1), 'p99': round(cuts[98], 1),
+            # The typical request's count, so a lock retry now and then doesn't move it.
+            'queries': int(statistics.median_low(queries)),
+            'queries_max': max(queries),
+            'errors': sum(row[2] for row in rows),
+        }
+
+
+class Till:
+    """One client's requests, with the state a till keeps between them."""
+
+    def __init__(self, rng, token, product_ids, customer_ids, names, reprints):
+        self.rng = rng
+        self.product_ids = product_ids
+        self.product_odds = zipf_weights(len(product_ids))
+        self.customer_ids = customer_ids
+        self.customer_odds = zipf_weights(len(customer_ids) - 1)
+        self.names = names
+        self.reprints = itertools.cycle(reprints)
+        self.catalog_etag = ''
+        self.cursors = {}
+        # 'testserver' isn't an allowed host here, and a 500 should count
+        # as a failed request rather than end the till.
+        self.client = APIClient(HTTP_HOST='localhost', raise_request_exception=False)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def next_endpoint(self):
+        return self.rng.choices(list(MIX), weights=list(MIX.values()))[0]
+
+    def create_invoice(self):
+        products = set(self.rng.choices(self.product_ids, cum_weights=self.product_odds, k=pick(self.rng, TILL_LINES)))
+        payload = {'items': [{'product': pk, 'quantity': pick(self.rng, QUANTITIES)} for pk in products]}
+        roll = self.rng.random()
+        if roll < NEW_CUSTOMER_SHARE:
+            payload['new_customer'] = {'name': make_name(self.rng).title(), 'phone': f'7{self.rng.randrange(10 ** 9):09d}'}
+        elif roll < NEW_CUSTOMER_SHARE + WALK_IN_SHARE:
+            payload['customer'] = self.customer_ids[0]
+        else:
+            payload['customer'] = self.rng.choices(self.customer_ids[1:], cum_weights=self.customer_odds)[0]
+        return self.client.post('/api/auth/invoice/create/', payload, format='json')
+
+    def product_list(self):
+        # Terminals revalidate the catalogue; it changes whenever stock moves.
+        response = self.client.get('/api/auth/products/', HTTP_IF_NONE_MATCH=self.catalog_etag)
+        self.catalog_etag = response.get('ETag', '')
+        return response
+
+    def customer_search(self):
+        # A lookup by the first letters of a name.
+        name = self.rng.choice(self.names)
+        return self.client.get('/api/auth/customers/', {'search': name[:self.rng.randint(3, 5)]})
+
+    def customer_list(self):
+        return self.page('/api/auth/customers/?page_size=50')
+
+    def invoice_list(self):
+        return self.page('/api/auth/invoices/?page_size=20')
+
+    def page(self, first):
+        # The first page, or the next one after the last page seen.
+        url = self.cursors.get(first) if self.rng.random() < 0.3 else None
+        response = self.client.get(url or first)
+        self.cursors[first] = response.data.get('next') if response.status_code == 200 else None
+        return response
+
+    def invoice_pdf(self):
+        return self.client.get(f'/api/auth/invoices/{next(self.reprints)}/pdf/')
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from accounts.authentication import StatelessStoreJWTAuthentication, StoreJWTAuthentication
+from accounts.models import Product, Store, User
+from accounts.store_cache import store_cache
+from accounts.tokens import StoreRefreshToken
+from accounts.views import ProductListView
+
+
+MODES = (
+    ('jwt', JWTAuthentication),
+    ('jwt+store-cache', StoreJWTAuthentication),
+    ('stateless', StatelessStoreJWTAuthentication),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/second and queries/request of ProductListView under each "
+        "JWT authentication mode. Runs in-process against a throwaway store that is "
+        "rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--products', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(username='bench-auth', password='bench-auth-password')
+            store = Store.objects.create(user=user, name='Bench Store')
+            Product.objects.bulk_create(
+                Product(store=store, name=f'Product {i}', price='10.00', stock=100)
+                for i in range(options['products'])
+            )
+            token = str(StoreRefreshToken.for_user(user).access_token)
+
+            self.stdout.write(f"{'mode':<18}{'req/s':>10}{'queries/req':>14}")
+            for name, authentication_class in MODES:
+                rate, queries = self.run(authentication_class, token, options['requests'])
+                self.stdout.write(f'{name:<18}{rate:>10.0f}{queries:>14.2f}')
+
+            transaction.set_rollback(True)
+        store_cache.clear()
+
+    def run(self, authentication_class, token, count):
+        view = ProductListView.as_view(authentication_classes=[authentication_class])
+        factory = APIRequestFactory()
+        store_cache.clear()
+
+        def request():
+            response = view(factory.get('/products/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+            response.render()
+            assert response.status_code == 200, response.status_code
+
+        request()  # warm caches
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                request()
+            elapsed = time.perf_counter() - started
+        return count / elapsed, len(queries.captured_queries) / count
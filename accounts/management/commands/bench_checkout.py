@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+
+from accounts.models import Customer, Product, Store, User
+
+
+# Database profile -> environment, on top of the profile's DATABASE_URL
+# (see the DATABASES comment in settings).
+PROFILES = {
+    'sqlite': {'SQLITE_WAL': '0'},
+    'sqlite-wal': {'SQLITE_WAL': '1'},
+    'postgres': {'DB_POOL': 'off'},
+    'postgres-pool': {'DB_POOL': 'psycopg'},
+    'pgbouncer': {'DB_POOL': 'pgbouncer'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure invoice throughput with concurrent tills under each database profile: "
+        "SQLite with the rollback journal and with WAL (each in a fresh temporary database), "
+        "and, given their URLs, PostgreSQL with persistent connections, with the psycopg "
+        "pool and through PgBouncer. Every till posts invoice/create/ in a loop. Throwaway "
+        "stores seeded in a PostgreSQL database are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=list(PROFILES),
+                            help='Repeatable. Defaults to every profile there is a database for.')
+        parser.add_argument('--postgres-url', help='Migrated PostgreSQL database for the postgres profiles.')
+        parser.add_argument('--pgbouncer-url', help='The same database through PgBouncer in transaction mode.')
+        parser.add_argument('--tills', type=int, default=8, help='Tills selling at once.')
+        parser.add_argument('--stores', type=int, default=2, help='Stores the tills are spread over.')
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--lines', type=int, default=3, help='Lines per invoice.')
+        parser.add_argument('--readers', type=int, default=2,
+                            help='Clients paging through the invoice list meanwhile, as a back office would.')
+        parser.add_argument('--seed', type=int, default=0)
+        # Set on the subprocess that runs one profile's tills.
+        parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['run']:
+            json.dump(self.run_tills(options), self.stdout)
+            return
+
+        profiles = options['profile'] or [
+            'sqlite', 'sqlite-wal',
+            *(['postgres', 'postgres-pool'] if options['postgres_url'] else []),
+            *(['pgbouncer'] if options['pgbouncer_url'] else []),
+        ]
+        self.stdout.write(
+            f"{options['tills']} tills over {options['stores']} stores, {options['lines']} lines "
+            f"per invoice, {options['readers']} readers, {options['seconds']:g}s per profile"
+        )
+        self.stdout.write(
+            f"{'profile':<15}{'invoices/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+            f"{'reads/s':>9}{'read p95':>10}"
+        )
+        for profile in profiles:
+            result = self.run_profile(profile, options)
+            self.stdout.write(
+                f"{profile:<15}{result['rate']:>11.1f}{result['p50']:>9.1f}{result['p95']:>9.1f}"
+                f"{result['p99']:>9.1f}{result['errors']:>8}{result['read_rate']:>9.1f}{result['read_p95']:>10.1f}"
+            )
+
+    def run_profile(self, profile, options):
+        with tempfile.TemporaryDirectory() as directory:
+            if profile.startswith('sqlite'):
+                url = f"sqlite:///{Path(directory) / 'db.sqlite3'}"
+            else:
+                url = options['pgbouncer_url'] if profile == 'pgbouncer' else options['postgres_url']
+                if not url:
+                    raise CommandError(f'The {profile} profile needs --{profile.split("-")[0]}-url.')
+            command = [
+                sys.executable, 'manage.py', 'bench_checkout', '--run',
+                '--tills', str(options['tills']), '--stores', str(options['stores']),
+                '--seconds', str(options['seconds']), '--lines', str(options['lines']),
+                '--readers', str(options['readers']), '--seed', str(options['seed']),
+            ]
+            env = {**os.environ, **PROFILES[profile], 'DATABASE_URL': url}
+            result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'{profile} failed:\n{result.stderr}')
+        return json.loads(result.stdout)
+
+    def run_tills(self, options):
+        if connection.vendor == 'sqlite':
+            call_command('migrate', verbosity=0)
+        rng = random.Random(options['seed'])
+        User.objects.filter(username__startswith='bench-checkout-').delete()
+        stores = [self.seed(index) for index in range(options['stores'])]
+        connection.close()
+
+        timings = []
+        reads = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['tills'] + options['readers'])
+        deadline = None
+
+        def client_loop(store, request, record):
+            # Outside the test runner 'testserver' isn't an allowed host.
+            client = APIClient(HTTP_HOST='localhost')
+            client.force_authenticate(store.user)
+            try:
+                barrier.wait()
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    response = request(client)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        record.append(elapsed)
+                        if response.status_code >= 300:
+                            errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        def sell(products, customers, seed):
+            pick = random.Random(seed)
+            return lambda client: client.post('/api/auth/invoice/create/', {
+                'customer': pick.choice(customers),
+                'items': [{'product': product, 'quantity': 1} for product in pick.sample(products, options['lines'])],
+            }, format='json')
+
+        def browse(client):
+            return client.get('/api/auth/invoices/?page_size=20')
+
+        threads = []
+        for index in range(options['tills']):
+            store, products, customers = stores[index % len(stores)]
+            request = sell(products, customers, rng.random())
+            threads.append(threading.Thread(target=client_loop, args=(store, request, timings)))
+        for index in range(options['readers']):
+            threads.append(threading.Thread(target=client_loop, args=(stores[index % len(stores)][0], browse, reads)))
+        deadline = time.perf_counter() + options['seconds']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        try:
+            cuts = statistics.quantiles(timings, n=100)
+            read_cuts = statistics.quantiles(reads, n=100) if len(reads) > 1 else [0] * 99
+            return {
+                'rate': len(timings) / options['seconds'],
+                'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98],
+                'errors': len(errors),
+                'read_rate': len(reads) / options['seconds'],
+                'read_p95': read_cuts[94],
+            }
+        finally:
+            User.objects.filter(username__startswith='bench-checkout-').delete()
+
+    def seed(self, index):
+        user = User.objects.create_user(username=f'bench-checkout-{index}', password='bench-checkout-password')
+        store = Store.objects.create(user=user, name=f'Bench Store {index}')
+        products = Product.objects.bulk_create(
+            Product(store=store, name=f'Product {i}', price=Decimal(10 + i), stock=10 ** 7) for i in range(100)
+        )
+        customers = Customer.objects.bulk_create(
+            Customer(store=store, name=f'Customer {i}', phone=f'9{index:03d}{i:06d}') for i in range(50)
+        )
+        return store, [product.pk for product in products], [customer.pk for customer in customers]
@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Customer, Store, User
+from accounts.search import search_customers
+
+
+# Names are two or three of these syllables, which gives tens of thousands
+# of distinct names with realistic overlap between them.
+SYLLABLES = [
+    'ra', 'vi', 'an', 'ita', 'su', 'resh', 'pri', 'ya', 'mo', 'ham', 'med', 'lak', 'shmi', 'ar',
+    'jun', 'fa', 'ti', 'ma', 'vik', 'ram', 'dee', 'pa', 'ku', 'mar', 'sha', 'red', 'dy', 'khan',
+    'iy', 'er', 'pat', 'el', 'sin', 'gh', 'na', 'ir', 'da', 'jo', 'shi', 'go', 'pal', 'sri',
+]
+
+
+def make_name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure customer search latency (p50/p95/p99) on a seeded store. Runs "
+        "against a throwaway store that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            user = User.objects.create_user(username='bench-search', password='bench-search-password')
+            store = Store.objects.create(user=user, name='Bench Store')
+            self.seed(store, options['customers'], rng)
+
+            queries = [self.query(rng) for _ in range(options['queries'])]
+            search_customers(store, queries[0], options['limit'])  # warm caches
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                search_customers(store, query, options['limit'])
+                timings.append((time.perf_counter() - started) * 1000)
+
+            cuts = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f"{options['customers']} customers, {len(queries)} queries: "
+                f"p50 {cuts[49]:.2f} ms  p95 {cuts[94]:.2f} ms  p99 {cuts[98]:.2f} ms"
+            )
+            transaction.set_rollback(True)
+
+    def seed(self, store, count, rng):
+        batch = []
+        for i in range(count):
+            first, last = make_name(rng), make_name(rng)
+            batch.append(Customer(
+                store=store,
+                name=f'{first.title()} {last.title()}',
+                phone=f'9{rng.randrange(10 ** 9):09d}',
+                email=f'{first}.{last}{i}@example.com',
+            ))
+            if len(batch) == 5000:
+                Customer.objects.bulk_create(batch)
+                batch = []
+        Customer.objects.bulk_create(batch)
+
+    def query(self, rng):
+        # Mix of what the picker sends: short name prefixes, fragments of a
+        # name, phone digits and email fragments.
+        kind = rng.randrange(4)
+        name = make_name(rng)
+        if kind == 0:
+            return name[:rng.randint(1, len(name))]
+        if kind == 1:
+            start = rng.randrange(len(name) - 2)
+            return name[start:start + rng.randint(3, len(name) - start)]
+        if kind == 2:
+            return f'9{rng.randrange(10 ** 4):04d}'
+        return f'{make_name(rng)}{rng.randrange(1000)}@'
@@ -0,0 +1,115 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts import gst
+from accounts.models import Customer, Invoice, InvoiceItem, Product, Store, User
+from accounts.rollups import gst_on
+from accounts.serializers import InvoiceReadSerializer
+
+RATES = [Decimal('0'), Decimal('5'), Decimal('12'), Decimal('18'), Decimal('28')]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every GST report grouping on a seeded store (1M invoices by default) "
+        "spread over a year. Runs against a throwaway store that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=1_000_000)
+        parser.add_argument('--lines', type=int, default=2, help='Lines per invoice.')
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--python', action='store_true',
+                            help='Also time summing by rate through the invoice serializer in Python, the old way.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            started = time.perf_counter()
+            store = self.seed(rng, options)
+            self.stdout.write(f"Seeded {options['invoices']} invoices in {time.perf_counter() - started:.1f}s")
+
+            end = timezone.localdate()
+            start = end - datetime.timedelta(days=options['days'] - 1)
+            self.stdout.write(f"{'grouping':<12}{'rows':>10}{'seconds':>10}")
+            for group_by in gst.COLUMNS:
+                started = time.perf_counter()
+                rows = gst.gst_summary(store, start, end, group_by).iterator()
+                count = sum(1 for _ in gst.csv_rows(rows, group_by)) - 1
+                self.stdout.write(f'{group_by:<12}{count:>10}{time.perf_counter() - started:>10.2f}')
+
+            if options['python']:
+                started = time.perf_counter()
+                totals = {}
+                invoices = Invoice.objects.filter(store=store).created_between(start, end)
+                for row in InvoiceReadSerializer(InvoiceReadSerializer.setup_eager_loading(invoices), many=True).data:
+                    bucket = totals.setdefault(row['gst_percentage'], [0, Decimal(0), Decimal(0)])
+                    bucket[0] += 1
+                    bucket[1] += Decimal(row['subtotal'])
+                    bucket[2] += Decimal(row['gst_amount'])
+                self.stdout.write(f"{'python/rate':<12}{len(totals):>10}{time.perf_counter() - started:>10.2f}")
+
+            transaction.set_rollback(True)
+
+    def seed(self, rng, options):
+        user = User.objects.create_user(username='bench-gst', password='bench-gst-password')
+        store = Store.objects.create(user=user, name='Bench Store')
+        Customer.objects.bulk_create(
+            Customer(store=store, name=f'Customer {i}') for i in range(options['customers'])
+        )
+        Product.objects.bulk_create(
+            Product(store=store, name=f'Product {i}', price=Decimal(rng.randrange(100, 100000)) / 100, stock=10 ** 6)
+            for i in range(options['products'])
+        )
+        customers = list(Customer.objects.filter(store=store).values_list('pk', flat=True))
+        products = list(Product.objects.filter(store=store).values_list('pk', 'price'))
+
+        # Invoices go in through raw SQL: bulk_create would stamp them all
+        # with auto_now_add's "now" instead of spreading them over the period.
+        now = timezone.now()
+        span = options['days'] * 86400
+        qn = connection.ops.quote_name
+        columns = ['store_id', 'customer_id', 'created_at', 'gst_percentage', 'subtotal', 'gst_amount', 'total']
+        sql = (
+            f"INSERT INTO {qn(Invoice._meta.db_table)} ({', '.join(map(qn, columns))}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        lines = []
+        batch = []
+        with connection.cursor() as cursor:
+            for i in range(options['invoices']):
+                rate = rng.choice(RATES)
+                basket = [(rng.choice(products), rng.randint(1, 5)) for _ in range(options['lines'])]
+                subtotal = sum(price * quantity for (_, price), quantity in basket)
+                gst_amount = gst_on(subtotal, rate)
+                created_at = now - datetime.timedelta(seconds=rng.randrange(span))
+                batch.append((
+                    store.pk, rng.choice(customers), connection.ops.adapt_datetimefield_value(created_at),
+                    rate, subtotal, gst_amount, subtotal + gst_amount,
+                ))
+                lines.append(basket)
+                if len(batch) == 10000:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+
+        invoice_ids = Invoice.objects.filter(store=store).order_by('pk').values_list('pk', flat=True)
+        items = []
+        for invoice_id, basket in zip(invoice_ids.iterator(chunk_size=10000), lines):
+            for (product_id, price), quantity in basket:
+                items.append(InvoiceItem(invoice_id=invoice_id, product_id=product_id, quantity=quantity, price=price))
+            if len(items) >= 10000:
+                InvoiceItem.objects.bulk_create(items)
+                items = []
+        InvoiceItem.objects.bulk_create(items)
+        return store
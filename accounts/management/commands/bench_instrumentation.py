@@ -0,0 +1,96 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from accounts.instrumentation import record_query
+from accounts.models import Invoice
+from accounts.tokens import StoreRefreshToken
+
+from .seed_bench import clear, seed_store
+
+
+MIDDLEWARE = 'accounts.instrumentation.InstrumentationMiddleware'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what the instrumentation middleware adds to a request. The same requests "
+        "go through the full middleware stack with and without it, in alternating rounds, "
+        "against a seeded store that is rolled back afterwards. Fails if the overall "
+        "overhead is above --max-overhead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=30)
+        parser.add_argument('--requests', type=int, default=20, help='Per endpoint per round.')
+        parser.add_argument('--max-overhead', type=float, default=0.01, help='As a fraction of request time.')
+
+    def handle(self, *args, **options):
+        if not settings.INSTRUMENTATION:
+            raise CommandError('Instrumentation is off (INSTRUMENTATION=0); nothing to measure.')
+        with transaction.atomic():
+            clear()
+            store, _, _ = seed_store(0, random.Random(0), 200, 500, 1000)
+            invoice = Invoice.objects.filter(store=store).latest('created_at', 'id')
+            token = str(StoreRefreshToken.for_user(store.user).access_token)
+            paths = [
+                '/api/auth/invoices/?page_size=20',
+                f'/api/auth/invoices/{invoice.pk}/',
+                '/api/auth/products/',
+                '/api/auth/customers/?page_size=50',
+                '/api/auth/customers/?search=ram',
+            ]
+            # Each client loads its middleware chain on its first request.
+            with override_settings(MIDDLEWARE=[name for name in settings.MIDDLEWARE if name != MIDDLEWARE]):
+                plain = self.client(token, paths[0])
+            instrumented = self.client(token, paths[0])
+
+            results = {path: {'plain': [], 'instrumented': []} for path in paths}
+            for index in range(options['rounds']):
+                # Alternate which goes first, so neither always runs warmer.
+                order = [('plain', plain), ('instrumented', instrumented)]
+                for name, client in order if index % 2 else order[::-1]:
+                    self.time_queries(name == 'instrumented')
+                    for path in paths:
+                        started = time.perf_counter()
+                        for _ in range(options['requests']):
+                            client.get(path)
+                        results[path][name].append((time.perf_counter() - started) / options['requests'] * 1000)
+            self.time_queries(True)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"median of {options['rounds']} rounds of {options['requests']} requests")
+        self.stdout.write(f"{'endpoint':<36}{'plain ms':>10}{'instr. ms':>11}{'overhead':>10}")
+        totals = {'plain': 0.0, 'instrumented': 0.0}
+        for path, timings in results.items():
+            plain_ms = statistics.median(timings['plain'])
+            instrumented_ms = statistics.median(timings['instrumented'])
+            totals['plain'] += plain_ms
+            totals['instrumented'] += instrumented_ms
+            self.stdout.write(
+                f'{path:<36}{plain_ms:>10.2f}{instrumented_ms:>11.2f}{instrumented_ms / plain_ms - 1:>10.1%}'
+            )
+        overhead = totals['instrumented'] / totals['plain'] - 1
+        self.stdout.write(f"{'all':<36}{totals['plain']:>10.2f}{totals['instrumented']:>11.2f}{overhead:>10.1%}")
+        if overhead > options['max_overhead']:
+            raise CommandError(f"Instrumentation adds {overhead:.1%}, over {options['max_overhead']:.0%}.")
+
+    def client(self, token, path):
+        client = APIClient(HTTP_HOST='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        client.get(path)
+        return client
+
+    def time_queries(self, on):
+        # Without the middleware the query wrapper wouldn't be installed either.
+        wrappers = connection.execute_wrappers
+        if on and record_query not in wrappers:
+            wrappers.append(record_query)
+        elif not on and record_query in wrappers:
+            wrappers.remove(record_query)
@@ -0,0 +1,231 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.client import HTTPConnection
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Customer, Invoice, InvoiceItem, Product, Store, User
+from accounts.tokens import StoreRefreshToken
+
+
+MODES = {
+    'wsgi': 'sync',
+    'asgi': 'uvicorn_worker.UvicornWorker',
+}
+
+# gunicorn config for the servers under test: the shipped gunicorn.conf.py
+# (or gunicorn's defaults with --no-config), bound to a free local port.
+# BENCH_DB_LATENCY_MS adds a sleep to every query, standing in for the
+# network round trip to a database on another host.
+GUNICORN_CONFIG = '''
+import os
+
+if os.environ['BENCH_BASE_CONFIG']:
+    with open(os.environ['BENCH_BASE_CONFIG']) as base:
+        exec(base.read())
+bind = os.environ['BENCH_BIND']
+loglevel = 'warning'
+_base_post_worker_init = globals().get('post_worker_init')
+
+
+def post_worker_init(worker):
+    if _base_post_worker_init is not None:
+        _base_post_worker_init(worker)
+    latency = float(os.environ['BENCH_DB_LATENCY_MS']) / 1000
+    if not latency:
+        return
+    import time
+    from django.db.backends.signals import connection_created
+
+    def slow(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def add_latency(sender, connection, **kwargs):
+        if slow not in connection.execute_wrappers:
+            connection.execute_wrappers.append(slow)
+
+    connection_created.connect(add_latency, weak=False)
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the read endpoints served by gunicorn under WSGI and under ASGI "
+        "(uvicorn workers, async views), with the shipped gunicorn.conf.py or with "
+        "gunicorn's defaults, and report throughput, latency and memory. Seeds a "
+        "throwaway store in the configured database and deletes it afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=[*MODES, 'both'], default='both')
+        parser.add_argument('--workers', type=int,
+                            help='Worker processes; by default gunicorn.conf.py sizes them from the cores.')
+        parser.add_argument('--no-config', action='store_true',
+                            help="Run with gunicorn's defaults instead of gunicorn.conf.py.")
+        parser.add_argument('--concurrency', type=int, default=32, help='Clients sending requests at once.')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help='Simulated database round trip added to every query.')
+        parser.add_argument('--path', action='append',
+                            help='Endpoint to request, repeatable; clients take turns over them. '
+                                 'Defaults to a page of invoices, of customers and the product list.')
+        parser.add_argument('--invoices', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        paths = options['path'] or [
+            '/api/auth/invoices/?page_size=20',
+            '/api/auth/customers/?page_size=50',
+            '/api/auth/products/',
+        ]
+        modes = list(MODES) if options['mode'] == 'both' else [options['mode']]
+
+        user = self.seed(options['invoices'])
+        token = str(StoreRefreshToken.for_user(user).access_token)
+        try:
+            self.stdout.write(
+                f"{'gunicorn defaults' if options['no_config'] else 'gunicorn.conf.py'}, "
+                f"{options['concurrency']} clients, {options['db_latency_ms']:g} ms per query"
+            )
+            self.stdout.write(
+                f"{'mode':<6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+                f"{'workers':>9}{'RSS MB':>9}{'PSS MB':>9}"
+            )
+            for mode in modes:
+                rate, timings, errors, memory = self.run(mode, paths, token, options)
+                cuts = statistics.quantiles(timings, n=100)
+                workers, rss, pss = memory
+                self.stdout.write(
+                    f'{mode:<6}{rate:>9.0f}{cuts[49]:>9.1f}{cuts[94]:>9.1f}{cuts[98]:>9.1f}{errors:>8}'
+                    f'{workers:>9}{rss / 1024:>9.0f}{pss / 1024:>9.0f}'
+                )
+        finally:
+            user.delete()
+
+    def seed(self, count):
+        User.objects.filter(username='bench-serving').delete()
+        user = User.objects.create_user(username='bench-serving', password='bench-serving-password')
+        store = Store.objects.create(user=user, name='Bench Store')
+        products = Product.objects.bulk_create(
+            Product(store=store, name=f'Product {i}', price=Decimal(100 + i), stock=10 ** 6) for i in range(200)
+        )
+        customers = Customer.objects.bulk_create(
+            Customer(store=store, name=f'Customer {i}', phone=f'9{i:09d}') for i in range(500)
+        )
+        invoices = Invoice.objects.bulk_create(
+            Invoice(store=store, customer=customers[i % len(customers)], subtotal=300, gst_amount=54, total=354)
+            for i in range(count)
+        )
+        InvoiceItem.objects.bulk_create(
+            InvoiceItem(invoice=invoice, product=products[(i + line) % len(products)], quantity=1, price=100)
+            for i, invoice in enumerate(invoices)
+            for line in range(3)
+        )
+        return user
+
+    def run(self, mode, paths, token, options):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as config:
+            config.write(GUNICORN_CONFIG)
+        env = {
+            **os.environ,
+            'SERVING_MODE': mode,
+            'BENCH_BIND': f'127.0.0.1:{port}',
+            'BENCH_BASE_CONFIG': '' if options['no_config'] else str(Path(settings.BASE_DIR) / 'gunicorn.conf.py'),
+            'BENCH_DB_LATENCY_MS': str(options['db_latency_ms']),
+        }
+        command = [sys.executable, '-m', 'gunicorn', '-c', config.name, f'billing_project.{mode}:application']
+        if options['no_config']:
+            command += ['--worker-class', MODES[mode]]
+        if options['workers']:
+            command += ['--workers', str(options['workers'])]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        try:
+            self.wait_until_up(port, server)
+            headers = {'Authorization': f'Bearer {token}'}
+            self.load(port, paths, headers, options['concurrency'] * 4, options['concurrency'])  # warm up
+            started = time.perf_counter()
+            timings, errors = self.load(port, paths, headers, options['requests'], options['concurrency'])
+            elapsed = time.perf_counter() - started
+            memory = self.memory(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+            os.unlink(config.name)
+        return options['requests'] / elapsed, timings, errors, memory
+
+    def wait_until_up(self, port, server):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Server exited with status {server.returncode}.')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError('Server did not start within 30 seconds.')
+
+    def load(self, port, paths, headers, count, concurrency):
+        timings = []
+        errors = []
+        issued = iter(range(count))
+        lock = threading.Lock()
+
+        def client():
+            # Sync workers close the connection after every response;
+            # HTTPConnection reconnects on its own.
+            connection = HTTPConnection('127.0.0.1', port, timeout=60)
+            while True:
+                with lock:
+                    index = next(issued, None)
+                if index is None:
+                    break
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', paths[index % len(paths)], headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except OSError:
+                    connection.close()
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    timings.append(elapsed)
+                    if not ok:
+                        errors.append(index)
+            connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, len(errors)
+
+    def memory(self, pid):
+        # Worker count, and resident and proportional set size (KiB) of the
+        # master and its workers. PSS splits shared pages between the
+        # processes sharing them, so it shows what preloading saves.
+        workers = Path(f'/proc/{pid}/task/{pid}/children').read_text().split()
+        rss = pss = 0
+        for process in [pid, *workers]:
+            for line in Path(f'/proc/{process}/smaps_rollup').read_text().splitlines():
+                if line.startswith('Rss:'):
+                    rss += int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    pss += int(line.split()[1])
+        return len(workers), rss, pss
@@ -0,0 +1,93 @@
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .importprofile import DEFAULT_PATH, boot
+
+
+# Modules a server must not import until a request needs them. Views are
+# routed lazily (see accounts.views), and WeasyPrint only loads in the
+# render pool.
+DEFERRED = (
+    'weasyprint',
+    'accounts.pdf',
+    'accounts.async_views',
+    'accounts.views.',
+    'rest_framework_simplejwt.views',
+)
+PHASES = ('import_ms', 'urls_ms', 'first_request_ms', 'total_ms')
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a cold server boot: a fresh interpreter imports the application, builds "
+        "the URLconf and serves one request. Reports the median of several runs and "
+        "fails if the total is slower than the recorded baseline by more than the "
+        "tolerance, or if boot imports a module that should load lazily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--runs', type=int, default=7)
+        parser.add_argument('--path', default=DEFAULT_PATH, help='Request served after boot.')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'startup.json'))
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed slowdown over the baseline, as a fraction.')
+        parser.add_argument('--update', action='store_true', help='Record these results as the new baseline.')
+
+    def handle(self, *args, **options):
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+        baseline_path = Path(options['baseline'])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+        self.stdout.write(f"median of {options['runs']} runs, first request to {options['path']}")
+        self.stdout.write(
+            f"{'mode':<6}{'import ms':>11}{'urls ms':>9}{'request ms':>12}{'total ms':>10}"
+            f"{'baseline':>10}{'modules':>9}"
+        )
+        failures = []
+        results = {}
+        for mode in modes:
+            result, modules = self.measure(mode, options['path'], options['runs'])
+            results[mode] = result
+            recorded = baseline.get(mode, {}).get('total_ms')
+            self.stdout.write(
+                f"{mode:<6}{result['import_ms']:>11.0f}{result['urls_ms']:>9.0f}"
+                f"{result['first_request_ms']:>12.0f}{result['total_ms']:>10.0f}"
+                f"{'-' if recorded is None else f'{recorded:.0f}':>10}{result['modules']:>9}"
+            )
+
+            eager = [module for module in modules if module.startswith(DEFERRED)]
+            if eager:
+                failures.append(f"{mode}: boot imported {', '.join(eager)}")
+            if recorded is not None and result['total_ms'] > recorded * (1 + options['tolerance']):
+                failures.append(
+                    f"{mode}: cold boot took {result['total_ms']:.0f} ms, over {recorded:.0f} ms "
+                    f"+{options['tolerance']:.0%}"
+                )
+
+        if options['update']:
+            baseline.update(results)
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Baseline written to {baseline_path}')
+        elif failures:
+            raise CommandError('Startup regressed:\n' + '\n'.join(failures))
+
+    def measure(self, mode, path, runs):
+        reports = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            report, _ = boot(mode, path)
+            # Includes starting the interpreter itself.
+            report['total_ms'] = (time.perf_counter() - started) * 1000
+            reports.append(report)
+        result = {phase: round(statistics.median(report[phase] for report in reports), 1) for phase in PHASES}
+        result['modules'] = len(reports[0]['modules'])
+        result['python'] = '.'.join(map(str, sys.version_info[:3]))
+        return result, reports[0]['modules']
@@ -0,0 +1,55 @@
+import os
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from accounts import pdf
+from accounts.models import Invoice
+
+
+class Command(BaseCommand):
+    help = "Render a store's invoices to PDF in parallel and write them into a zip."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, required=True, help='Store id.')
+        parser.add_argument('--from', dest='start', help='First day, YYYY-MM-DD.')
+        parser.add_argument('--to', dest='end', help='Last day, YYYY-MM-DD (inclusive).')
+        parser.add_argument('--ids', help='Comma-separated invoice ids; overrides --from/--to.')
+        parser.add_argument('--output', required=True, help='Path of the zip to write.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Render processes (default: one per core).')
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.filter(store_id=options['store'])
+        if options['ids']:
+            try:
+                invoices = invoices.filter(pk__in=[int(pk) for pk in options['ids'].split(',')])
+            except ValueError:
+                raise CommandError('--ids must be a comma-separated list of ids.')
+        else:
+            days = []
+            for name in ('start', 'end'):
+                day = parse_date(options[name]) if options[name] else None
+                if options[name] and day is None:
+                    raise CommandError(f"--{'from' if name == 'start' else 'to'} must be a YYYY-MM-DD date.")
+                days.append(day)
+            invoices = invoices.created_between(*days)
+
+        workers = max(1, options['workers'])
+        count = failed = 0
+        executor = pdf.make_executor(workers)
+        try:
+            entries = pdf.render_batch(pdf.invoice_html(invoices), executor, window=workers * 4)
+            with zipfile.ZipFile(options['output'], 'w', compression=zipfile.ZIP_STORED) as archive:
+                for name, error in pdf.write_zip(archive, entries):
+                    if error is None:
+                        count += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(f'{name}: {error}')
+        finally:
+            executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} invoice PDFs to {options['output']}"))
+        if failed:
+            raise CommandError(f'{failed} invoices failed to render; they are listed in {pdf.ERRORS_MEMBER} in the zip.')
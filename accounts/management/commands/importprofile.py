@@ -0,0 +1,143 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Cold boot of a server process, run in a fresh interpreter: import the
+# application, build the URLconf, then serve one request by calling the
+# application directly. Prints the time each step took, the response
+# status and the modules loaded before the request, as JSON on stdout.
+BOOT = '''
+import json, os, sys, time
+
+started = time.perf_counter()
+mode = os.environ['SERVING_MODE']
+application = __import__(f'billing_project.{mode}', fromlist=['application']).application
+loaded = time.perf_counter()
+
+from django.urls import get_resolver
+
+get_resolver().url_patterns
+routed = time.perf_counter()
+modules = sorted(sys.modules)
+
+path, _, query = sys.argv[1].partition('?')
+statuses = []
+if mode == 'asgi':
+    import asyncio
+
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # the client never disconnects
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    asyncio.run(application({
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }, receive, send))
+else:
+    from io import BytesIO
+
+    response = application({
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': 'localhost',
+        'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+    }, lambda status, headers, exc_info=None: statuses.append(int(status.split()[0])))
+    b''.join(response)
+    response.close()
+served = time.perf_counter()
+
+json.dump({
+    'import_ms': (loaded - started) * 1000,
+    'urls_ms': (routed - loaded) * 1000,
+    'first_request_ms': (served - routed) * 1000,
+    'status': statuses[0],
+    'modules': modules,
+}, sys.stdout)
+'''
+
+DEFAULT_PATH = '/api/auth/products/'
+
+
+def boot(mode, path, *python_options):
+    """Run BOOT in a fresh interpreter; return its report and its stderr."""
+    result = subprocess.run(
+        [sys.executable, *python_options, '-c', BOOT, path],
+        cwd=settings.BASE_DIR, env={**os.environ, 'SERVING_MODE': mode}, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise CommandError(f'Boot failed:\n{result.stderr}')
+    return json.loads(result.stdout), result.stderr
+
+
+class Command(BaseCommand):
+    help = (
+        "Show where a cold server boot spends its import time: imports the application "
+        "in a fresh interpreter under -X importtime, builds the URLconf and serves one "
+        "request, then lists the slowest modules (or top-level packages)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--path', default=DEFAULT_PATH, help='Request served after boot.')
+        parser.add_argument('--by', choices=['module', 'package'], default='module',
+                            help='Rank single modules, or top-level packages by the sum of their own time.')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative',
+                            help='Module ranking: time including, or excluding, the imports a module makes.')
+        parser.add_argument('--top', type=int, default=25)
+
+    def handle(self, *args, **options):
+        report, stderr = boot(options['mode'], options['path'], '-X', 'importtime')
+        booted = set(report['modules'])
+
+        # "import time: self [us] | cumulative | imported package", one line
+        # per module, nested imports indented and listed before their parent.
+        timings = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            timings.append((name.strip(), int(own) / 1000, int(cumulative) / 1000))
+        total = sum(own for _, own, _ in timings)
+        at_request = sum(own for name, own, _ in timings if name not in booted)
+
+        self.stdout.write(
+            f"{options['mode']}: {len(timings)} modules, {total:.0f} ms importing "
+            f"({at_request:.0f} ms of it during the first request to {options['path']}, "
+            f"status {report['status']})"
+        )
+        self.stdout.write(
+            f"boot {report['import_ms']:.0f} ms, URLconf {report['urls_ms']:.0f} ms, "
+            f"first request {report['first_request_ms']:.0f} ms"
+        )
+
+        if options['by'] == 'package':
+            packages = defaultdict(float)
+            counts = defaultdict(int)
+            for name, own, _ in timings:
+                packages[name.split('.')[0]] += own
+                counts[name.split('.')[0]] += 1
+            self.stdout.write(f"{'package':<48}{'modules':>8}{'self ms':>10}")
+            for package, own in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+                self.stdout.write(f'{package:<48}{counts[package]:>8}{own:>10.1f}')
+            return
+
+        column = 2 if options['sort'] == 'cumulative' else 1
+        self.stdout.write(f"{'module':<48}{'self ms':>10}{'cumul ms':>10}  loaded")
+        for name, own, cumulative in sorted(timings, key=lambda timing: -timing[column])[:options['top']]:
+            self.stdout.write(
+                f"{name:<48}{own:>10.1f}{cumulative:>10.1f}  {'boot' if name in booted else 'request'}"
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts import rollups
+from accounts.models import Store
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from invoices, for some or all stores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, action='append', help='Store id; repeat for several. Default: all.')
+
+    def handle(self, *args, **options):
+        stores = Store.objects.order_by('pk')
+        if options['store']:
+            stores = stores.filter(pk__in=options['store'])
+        for store_id in stores.values_list('pk', flat=True).iterator():
+            days, product_days = rollups.rebuild(store_id)
+            self.stdout.write(f'Store {store_id}: {days} days, {product_days} product-days')
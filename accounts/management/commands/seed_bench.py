@@ -0,0 +1,145 @@
+import datetime
+import itertools
+import random
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Customer, Invoice, InvoiceItem, Product, Store, User
+from accounts.rollups import gst_on
+
+from .bench_customer_search import make_name
+
+
+USERNAME_PREFIX = 'bench-store-'
+
+# Shapes of a corner shop's sales: most bills are short, most lines are a
+# single unit, a few products and regulars account for much of the trade,
+# and about one bill in five is for a walk-in.
+LINES = {1: 30, 2: 22, 3: 16, 4: 11, 5: 8, 6: 5, 8: 4, 12: 3, 20: 1}
+QUANTITIES = {1: 70, 2: 15, 3: 7, 4: 4, 6: 3, 10: 1}
+GST_RATES = {5: 15, 12: 20, 18: 55, 28: 10}
+WALK_IN_SHARE = 0.2
+POPULARITY_SKEW = 1.1
+
+
+def zipf_weights(count, skew=POPULARITY_SKEW):
+    """Cumulative weights for picking item ``i`` of ``count`` with odds 1/(i+1)^skew."""
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def seed_store(index, rng, products, customers, invoices, days=90):
+    """Create store ``index`` with its user, catalogue, customers and bill history.
+
+    Returns ``(store, product_ids, customer_ids)``. Bills are spread evenly
+    over the last ``days`` days and carry the same totals and snapshot
+    columns checkout would have written; stock is left high enough to sell
+    from. Rollups are not touched; see rebuild_sales_rollups.
+    """
+    user = User.objects.create_user(username=f'{USERNAME_PREFIX}{index}', password='bench-store-password')
+    store = Store.objects.create(
+        user=user, name=f'Bench Store {index}', address=f'{index + 1} Market Road', contact=f'80{index:08d}',
+    )
+    catalogue = Product.objects.bulk_create(
+        Product(
+            store=store,
+            name=f'{make_name(rng).title()} {i}',
+            sku=f'B{index}-{i:06d}',
+            price=Decimal(min(max(round(rng.lognormvariate(4, 1)), 5), 5000)),
+            stock=10 ** 7,
+            reorder_level=10,
+        )
+        for i in range(products)
+    )
+    regulars = Customer.objects.bulk_create(
+        Customer(
+            store=store,
+            name='Walk-in' if i == 0 else make_name(rng).title(),
+            phone=f'9{index:03d}{i:06d}',
+        )
+        for i in range(customers)
+    )
+    rng.shuffle(catalogue)
+    product_odds = zipf_weights(len(catalogue))
+    customer_odds = zipf_weights(len(regulars) - 1) if len(regulars) > 1 else None
+
+    start = timezone.now() - datetime.timedelta(days=days)
+    step = datetime.timedelta(days=days) / max(invoices, 1)
+    bills = []
+    for i in range(invoices):
+        if customer_odds is None or rng.random() < WALK_IN_SHARE:
+            customer = regulars[0]
+        else:
+            customer = rng.choices(regulars[1:], cum_weights=customer_odds)[0]
+        chosen = {product.pk: product for product in rng.choices(catalogue, cum_weights=product_odds, k=pick(rng, LINES))}
+        lines = [(product, pick(rng, QUANTITIES)) for product in chosen.values()]
+        rate = pick(rng, GST_RATES)
+        subtotal = sum(product.price * quantity for product, quantity in lines)
+        gst_amount = gst_on(subtotal, rate)
+        invoice = Invoice(
+            store=store, customer=customer, gst_percentage=rate, subtotal=subtotal,
+            gst_amount=gst_amount, total=subtotal + gst_amount, item_count=len(lines),
+            customer_name=customer.name, store_name=store.name,
+            store_address=store.address, store_contact=store.contact,
+        )
+        bills.append((invoice, start + step * i, lines))
+
+    for offset in range(0, len(bills), 2000):
+        batch = bills[offset:offset + 2000]
+        created = Invoice.objects.bulk_create([invoice for invoice, _, _ in batch])
+        # created_at is auto_now_add, so the history is written afterwards.
+        for invoice, (_, created_at, _) in zip(created, batch):
+            invoice.created_at = created_at
+        Invoice.objects.bulk_update(created, ['created_at'])
+        InvoiceItem.objects.bulk_create(
+            InvoiceItem(invoice=invoice, product=product, quantity=quantity, price=product.price)
+            for invoice, _, lines in batch
+            for product, quantity in lines
+        )
+    return store, [product.pk for product in catalogue], [customer.pk for customer in regulars]
+
+
+def clear():
+    User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed benchmark stores into the configured database: each gets a catalogue, a "
+        "customer base and an invoice history with realistic bill sizes, quantities, "
+        "GST rates and product and customer popularity. Stores from an earlier run "
+        "are replaced. The same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=3)
+        parser.add_argument('--products', type=int, default=500, help='Per store.')
+        parser.add_argument('--customers', type=int, default=2000, help='Per store.')
+        parser.add_argument('--invoices', type=int, default=5000, help='Per store.')
+        parser.add_argument('--days', type=int, default=90, help='Span of the invoice history.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Only delete the benchmark stores.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clear()
+            if options['clear']:
+                return
+            rng = random.Random(options['seed'])
+            stores = [
+                seed_store(index, rng, options['products'], options['customers'], options['invoices'], options['days'])[0]
+                for index in range(options['stores'])
+            ]
+        call_command('rebuild_sales_rollups', *[f'--store={store.pk}' for store in stores])
+        self.stdout.write(
+            f"Seeded {len(stores)} stores ({', '.join(f'{USERNAME_PREFIX}{i}' for i in range(len(stores)))}), "
+            f"each with {options['products']} products, {options['customers']} customers "
+            f"and {options['invoices']} invoices."
+        )
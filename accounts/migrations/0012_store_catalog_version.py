@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='catalog_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def number_existing_rows(apps, schema_editor):
+    # Give rows that predate change tracking distinct sequence numbers so a
+    # first sync can page through them like any other changes.
+    Store = apps.get_model('accounts', 'Store')
+    for store in Store.objects.all().iterator():
+        seq = 0
+        for model_name in ('Product', 'Customer'):
+            Model = apps.get_model('accounts', model_name)
+            rows = list(Model.objects.filter(store=store).order_by('pk').only('pk'))
+            for row in rows:
+                seq += 1
+                row.change_seq = seq
+            Model.objects.bulk_update(rows, ['change_seq'], batch_size=1000)
+        Store.objects.filter(pk=store.pk).update(change_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_store_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('change_seq', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['store', 'change_seq'], name='accounts_cu_store_i_83ca14_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'change_seq'], name='accounts_pr_store_i_5e68c5_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.store'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['store', 'change_seq'], name='accounts_to_store_i_d24ad4_idx'),
+        ),
+        migrations.RunPython(number_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('store', 'idempotency_key'), name='unique_invoice_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:12
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def create_search_indexes(apps, schema_editor):
+    # Postgres only; SQLite gets its FTS5 table from accounts.search after
+    # every migrate. btree_gin lets store_id share the GIN index.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS accounts_customer_search_trgm '
+        'ON accounts_customer USING gin (store_id, search_text gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS accounts_customer_search_prefix '
+        'ON accounts_customer (store_id, (search_text COLLATE "C"))'
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS accounts_customer_search_trgm')
+        schema_editor.execute('DROP INDEX IF EXISTS accounts_customer_search_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_invoice_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='search_text',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(django.db.models.functions.text.Concat('name', models.Value(' '), 'phone', models.Value(' '), 'email')), output_field=models.TextField()),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
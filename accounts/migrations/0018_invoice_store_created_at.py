@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['store', 'created_at'], name='accounts_in_store_i_a47bf4_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_stock_alerts'),
+    ]
+
+    operations = [
+        # New indexes first, so no query is left without one in between.
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['store', 'id'], name='accounts_cu_store_i_242539_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['store', 'created_at', 'id'], name='accounts_in_store_i_743ab5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceitem',
+            index=models.Index(fields=['invoice', 'product'], include=('quantity', 'price'), name='invoice_item_lines'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'id'], name='accounts_pr_store_i_3dc018_idx'),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='store',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.store'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='store',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.store'),
+        ),
+        migrations.AlterField(
+            model_name='invoiceitem',
+            name='invoice',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='accounts.invoice'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='store',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.store'),
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='accounts_in_store_i_a47bf4_idx',
+        ),
+    ]
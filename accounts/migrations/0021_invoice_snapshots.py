@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_snapshots(apps, schema_editor):
+    # Existing invoices take today's customer and store details; there is
+    # nothing older to go by.
+    Invoice = apps.get_model('accounts', 'Invoice')
+    InvoiceItem = apps.get_model('accounts', 'InvoiceItem')
+    Customer = apps.get_model('accounts', 'Customer')
+    Store = apps.get_model('accounts', 'Store')
+    store = Store.objects.filter(pk=OuterRef('store_id'))
+    lines = InvoiceItem.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice').annotate(n=Count('*'))
+    Invoice.objects.update(
+        item_count=Coalesce(Subquery(lines.values('n')), 0),
+        customer_name=Subquery(Customer.objects.filter(pk=OuterRef('customer_id')).values('name')),
+        store_name=Subquery(store.values('name')),
+        store_address=Subquery(store.values('address')),
+        store_contact=Subquery(store.values('contact')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_tenant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='customer_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='store_address',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='store_contact',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='store_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+        # Replaces the plain (store, created_at, id) index, after the
+        # backfill so the new one is built once over final values.
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['store', 'created_at', 'id'], include=('customer', 'customer_name', 'store_name', 'item_count', 'subtotal', 'gst_percentage', 'gst_amount', 'total'), name='invoice_list'),
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='accounts_in_store_i_743ab5_idx',
+        ),
+    ]
@@ -1,5 +1,10 @@
+import datetime
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Lower
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from decimal import Decimal
 from django.contrib.auth.models import User
@@ -26,10 +31,83 @@ class Store(models.Model):
     address = models.TextField(blank=True)
     contact = models.CharField(max_length=100, null=True, blank=True)  #
     description = models.TextField(null=True, blank=True)
+    # Bumped on every product write; see accounts.catalog.
+    catalog_version = models.PositiveBigIntegerField(default=0)
+    # Last change sequence number handed out to a product, customer or
+    # tombstone of this store; see allocate_change_seq.
+    change_seq = models.PositiveBigIntegerField(default=0)
+
+    COUNTER_FIELDS = ('catalog_version', 'change_seq')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Counters only ever move through UPDATE ... + 1; a full save from a
+        # stale instance must not roll them back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def allocate_change_seq(cls, store_id, catalog=False):
+        """Reserve the store's next change sequence number.
+
+        Must run inside the transaction that writes the changed rows: the
+        UPDATE locks the store row until commit, so rows become visible in
+        sequence order and a sync cursor can never skip past a row that
+        commits late. ``catalog`` also bumps the catalog version.
+        """
+        counters = {'change_seq': F('change_seq') + 1}
+        if catalog:
+            counters['catalog_version'] = F('catalog_version') + 1
+        cls.objects.filter(pk=store_id).update(**counters)
+        return cls.objects.filter(pk=store_id).values_list('change_seq', flat=True).get()
+
+
+class ChangeTrackedModel(models.Model):
+    """Stamps every save with the store's next change sequence number and
+    leaves a Tombstone behind on delete, for delta sync."""
+    change_seq = models.PositiveBigIntegerField(default=0)
+
+    bumps_catalog = False
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self.change_seq = Store.allocate_change_seq(self.store_id, catalog=self.bumps_catalog)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'change_seq'}
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Tombstone.objects.create(
+                store_id=self.store_id,
+                model=self._meta.model_name,
+                object_id=self.pk,
+                change_seq=Store.allocate_change_seq(self.store_id, catalog=self.bumps_catalog),
+            )
+            return super().delete(*args, **kwargs)
+
+
+class Tombstone(models.Model):
+    """Marks a deleted product or customer so syncing clients can drop it."""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    change_seq = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['store', 'change_seq'])]
+
 
 # Custom user model with link to Store and Plan
 class User(AbstractUser):
@@ -38,44 +116,153 @@ class User(AbstractUser):
     subscription_start = models.DateField(null=True, blank=True)
     subscription_end = models.DateField(null=True, blank=True)
     is_active_subscriber = models.BooleanField(default=False)
+    # Bumped whenever something a JWT vouches for changes; tokens stamped with
+    # an older version are rejected by the stateless authentication mode.
+    token_version = models.PositiveIntegerField(default=0)
+
+    TOKEN_CLAIM_FIELDS = ('password', 'is_active', 'is_active_subscriber', 'subscription_end')
 
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._token_claims = {
+            name: getattr(instance, name) for name in cls.TOKEN_CLAIM_FIELDS if name in field_names
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_token_claims', None)
+        if loaded and any(getattr(self, name) != value for name, value in loaded.items()):
+            self.token_version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'token_version'}
+        super().save(*args, **kwargs)
+        self._token_claims = {name: getattr(self, name) for name in self.TOKEN_CLAIM_FIELDS}
+
 
 # Customer model
-class Customer(models.Model):
+class Customer(ChangeTrackedModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True)  # temporarily allow null
-    store = models.ForeignKey(Store, on_delete=models.CASCADE,null=False)
+    # Indexed as the leading column of the composite indexes below.
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=False, db_index=False)
     name = models.CharField(max_length=100)
     address = models.TextField(blank=True)
     phone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
+    # What the customer picker searches; see accounts.search.
+    search_text = models.GeneratedField(
+        expression=Lower(Concat('name', Value(' '), 'phone', Value(' '), 'email')),
+        output_field=models.TextField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'change_seq']),
+            # The customer list pages through a store in id order.
+            models.Index(fields=['store', 'id']),
+        ]
 
 def __str__(self):
         return self.name
 
 
 # Product model
-class Product(models.Model):
-    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+class Product(ChangeTrackedModel):
+    # Indexed as the leading column of the composite indexes below.
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
+    # Barcode / SKU the till scans; unique within a store.
+    sku = models.CharField(max_length=64, null=True, blank=True)
+    # A sale that takes stock down to this level raises a StockAlert; null
+    # means the product isn't tracked.
+    reorder_level = models.PositiveIntegerField(null=True, blank=True)
+
+    bumps_catalog = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'change_seq']),
+            # The catalog is listed in id order.
+            models.Index(fields=['store', 'id']),
+            # Only rows at or below their reorder level are in this index,
+            # so listing a store's low-stock products never walks the catalog.
+            models.Index(
+                fields=['store', 'id'], name='product_low_stock',
+                condition=models.Q(stock__lte=F('reorder_level')),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'sku'], name='unique_product_sku'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class InvoiceQuerySet(models.QuerySet):
+    def created_between(self, start=None, end=None):
+        """Invoices created on or after ``start`` and on or before ``end`` (dates, inclusive)."""
+        invoices = self
+        if start is not None:
+            invoices = invoices.filter(created_at__gte=_start_of_day(start))
+        if end is not None:
+            invoices = invoices.filter(created_at__lt=_start_of_day(end + datetime.timedelta(days=1)))
+        return invoices
+
+
+def _start_of_day(day):
+    # A range filter on created_at itself, unlike created_at__date, can use an index.
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
 # Invoice model
 class Invoice(models.Model):
-    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    # Indexed as the leading column of the composite indexes below.
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, db_index=False)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     gst_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=18.00)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     gst_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Client-generated key for invoices billed offline; a re-upload with the
+    # same key gets the original invoice back instead of a second one.
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    # Written once by checkout, so a bill keeps showing the customer and
+    # store as they were when it was made, and lists need no joins.
+    item_count = models.PositiveIntegerField(default=0)
+    customer_name = models.CharField(max_length=100, blank=True, default='')
+    store_name = models.CharField(max_length=100, blank=True, default='')
+    store_address = models.TextField(blank=True, default='')
+    store_contact = models.CharField(max_length=100, null=True, blank=True)
+
+    # Snapshot field -> Store field.
+    STORE_SNAPSHOT = {'store_name': 'name', 'store_address': 'address', 'store_contact': 'contact'}
+
+    objects = InvoiceQuerySet.as_manager()
+
+    class Meta:
+        # Lists page newest first by (created_at, id) and exports and reports
+        # read a created_at range; id makes the order total, so neither sorts.
+        # On Postgres the list columns ride along, so a page of the invoice
+        # list is an index-only scan.
+        indexes = [
+            models.Index(
+                fields=['store', 'created_at', 'id'], name='invoice_list',
+                include=['customer', 'customer_name', 'store_name', 'item_count',
+                         'subtotal', 'gst_percentage', 'gst_amount', 'total'],
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'idempotency_key'], name='unique_invoice_idempotency_key'),
+        ]
 
     def __str__(self):
         return f"Invoice {self.id} - {self.customer.name}"
@@ -83,10 +270,63 @@ class Invoice(models.Model):
 
 # Invoice Item model
 class InvoiceItem(models.Model):
-    invoice = models.ForeignKey(Invoice, related_name='items', on_delete=models.CASCADE)
+    # Indexed as the leading column of invoice_item_lines.
+    invoice = models.ForeignKey(Invoice, related_name='items', on_delete=models.CASCADE, db_index=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # Items are always fetched by invoice, for a page of invoices at
+            # once. On Postgres the GST report's per-line sums are answered
+            # from the index alone.
+            models.Index(
+                fields=['invoice', 'product'], name='invoice_item_lines',
+                include=['quantity', 'price'],
+            ),
+        ]
+
     def subtotal(self):
-        return self.quantity * self.price
\ No newline at end of file
+        return self.quantity * self.price
+
+# Sales rollups; see accounts.rollups.
+class DailySales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    day = models.DateField()
+    invoices = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    gst_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'day'], name='unique_daily_sales'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveBigIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    gst_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+
+class StockAlert(models.Model):
+    """A sale that took a product's stock down to its reorder level."""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    stock = models.PositiveIntegerField()
+    reorder_level = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The alert feed reads a store's alerts after a given id.
+        indexes = [models.Index(fields=['store', 'id'])]
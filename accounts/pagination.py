@@ -0,0 +1,128 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks on an indexed column tuple.
+
+    Each page is ``WHERE (ordering) > (cursor) ORDER BY ordering LIMIT n``, so
+    page cost does not depend on how deep into the table the client is. Unlike
+    DRF's CursorPagination the cursor carries every ordering column, so ties
+    on ``created_at`` never need an OFFSET.
+
+    Paging is opt-in: without ``page_size`` or ``cursor`` in the query string
+    the view keeps returning a plain list, as before.
+    """
+    ordering = ('id',)
+    page_size = 100
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request)
+        if page is None:
+            return None
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, through the async ORM."""
+        page = self.page_queryset(queryset, request)
+        if page is None:
+            return None
+        return self.set_page([obj async for obj in page])
+
+    def page_queryset(self, queryset, request):
+        # The page, plus one row to tell whether there is a next one.
+        params = request.query_params
+        if self.page_size_query_param not in params and self.cursor_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        encoded = params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.seek(self.decode_cursor(encoded)))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def seek(self, values):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), per column direction.
+        condition = Q()
+        equal = {}
+        for name, field, value in zip(self.ordering, self.fields, values):
+            op = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field.attname}__{op}': value})
+            equal[field.attname] = value
+        # Implied by the above, but planners can't start an index range scan
+        # from an OR; this bound gives them a (store, a) range to start at.
+        name, field, value = self.ordering[0], self.fields[0], values[0]
+        op = 'lte' if name.startswith('-') else 'gte'
+        return Q(**{f'{field.attname}__{op}': value}) & condition
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, encoded):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class InvoiceCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class IdCursorPagination(KeysetPagination):
+    ordering = ('id',)
@@ -0,0 +1,247 @@
+"""Invoice PDF cache and background render queue.
+
+A PDF is stored under the SHA-256 of the HTML it was rendered from, so any
+change to the invoice (or the template) produces a new key and a stale file
+is simply never looked up again. Misses are rendered by a per-process pool
+of worker processes; web workers only hash, check the disk and hand off.
+Batches (``render_batch``) go through the same cache and can be streamed
+into a zip with ``stream_zip`` as each PDF finishes; a PDF that fails to
+render is left out and named in the zip's ``errors.txt``.
+
+This module must stay importable without Django apps being loaded: spawned
+pool workers import it to find ``render_to_file``.
+"""
+import functools
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Lists the invoices a batch zip had to leave out.
+ERRORS_MEMBER = 'errors.txt'
+
+_executor = None
+_pending = {}
+_lock = threading.RLock()
+
+
+def cache_key(html_string):
+    return hashlib.sha256(html_string.encode('utf-8')).hexdigest()
+
+
+def cache_path(key):
+    return Path(settings.INVOICE_PDF_CACHE_DIR) / key[:2] / f'{key}.pdf'
+
+
+def lookup(key):
+    """Return the cached PDF path for ``key``, or None if it isn't rendered yet."""
+    path = cache_path(key)
+    return path if path.exists() else None
+
+
+def render_to_file(html_string, path):
+    # Runs in a pool worker. Write to a temp file first so a reader never
+    # sees a half-written PDF.
+    from weasyprint import HTML
+
+    if _worker is None:
+        _warm_up()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            HTML(string=html_string).write_pdf(fh, **_worker)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return str(path)
+
+
+# Per-worker render state: fonts, parsed stylesheets and decoded images are
+# loaded once and shared by every document the worker renders.
+_worker = None
+
+
+def _warm_up(stylesheet_paths=()):
+    global _worker
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    _worker = {
+        'font_config': font_config,
+        'stylesheets': [CSS(filename=str(name), font_config=font_config) for name in stylesheet_paths],
+        'cache': {},
+    }
+
+
+def make_executor(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_warm_up,
+        initargs=(tuple(settings.INVOICE_PDF_STYLESHEETS),),
+    )
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = make_executor(settings.PDF_RENDER_WORKERS)
+        return _executor
+
+
+def _reset_executor(broken):
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def schedule(key, html_string):
+    """Queue a render for ``key`` unless one is already in flight.
+
+    A render that fails is logged and forgotten, so the next request for the
+    key queues a fresh attempt.
+    """
+    executor = get_executor()
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            try:
+                future = executor.submit(render_to_file, html_string, str(cache_path(key)))
+            except BrokenProcessPool:
+                # A worker died (OOM on a huge invoice, say); start a fresh pool.
+                _reset_executor(executor)
+                future = get_executor().submit(render_to_file, html_string, str(cache_path(key)))
+            _pending[key] = future
+            future.add_done_callback(functools.partial(_finished, key))
+    return future
+
+
+def _finished(key, future):
+    # Successful renders are on disk now; failures are reported here, once,
+    # rather than to whichever unrelated request polls next.
+    exc = future.exception()
+    if exc is not None:
+        logger.error('Rendering invoice PDF %s failed', key, exc_info=exc)
+    with _lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def invoice_html(invoices):
+    """Yield ``(filename, html)`` for each invoice in ``invoices``, oldest first."""
+    # Imported here so pool workers can load this module without Django apps.
+    from django.template.loader import render_to_string
+    from .serializers import InvoiceDetailSerializer
+
+    invoices = InvoiceDetailSerializer.setup_eager_loading(invoices.order_by('created_at', 'id'))
+    for invoice in invoices.iterator(chunk_size=200):
+        yield f'invoice_{invoice.pk}.pdf', render_to_string('invoice_template.html', {'invoice': invoice})
+
+
+def render_batch(jobs, executor, window):
+    """Yield ``(name, path, error)`` for each ``(name, html)`` job as its PDF is ready.
+
+    Cached PDFs come back straight away; misses are rendered on ``executor``
+    with at most ``window`` in flight, and are yielded in completion order.
+    A render that fails comes back with no path and its exception as
+    ``error``, so one bad invoice doesn't take the rest of the batch with it.
+    """
+    in_flight = {}
+    for name, html_string in jobs:
+        key = cache_key(html_string)
+        path = lookup(key)
+        if path is not None:
+            yield name, path, None
+            continue
+        try:
+            future = executor.submit(render_to_file, html_string, str(cache_path(key)))
+        except BrokenProcessPool as exc:
+            logger.error('Rendering %s failed', name, exc_info=exc)
+            yield name, None, exc
+            continue
+        in_flight[future] = name
+        if len(in_flight) >= window:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _outcome(in_flight.pop(future), future)
+    for future in as_completed(list(in_flight)):
+        yield _outcome(in_flight.pop(future), future)
+
+
+def _outcome(name, future):
+    exc = future.exception()
+    if exc is not None:
+        logger.error('Rendering %s failed', name, exc_info=exc)
+        return name, None, exc
+    return name, Path(future.result()), None
+
+
+class _ZipSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def write_zip(archive, entries):
+    """Add ``(name, path, error)`` entries to ``archive``, yielding each as it goes in.
+
+    Entries that failed are left out of the archive and listed, one per line,
+    in an ``errors.txt`` member written last.
+    """
+    failed = []
+    for name, path, error in entries:
+        if error is None:
+            archive.write(path, arcname=name)
+        else:
+            failed.append(f'{name}: {type(error).__name__}: {error}\n')
+        yield name, error
+    if failed:
+        archive.writestr(ERRORS_MEMBER, ''.join(failed))
+
+
+def stream_zip(entries):
+    """Yield a zip archive of ``(name, path, error)`` entries piece by piece.
+
+    PDFs are already compressed, so members are stored as-is. See
+    ``write_zip`` for what happens to failed entries.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for _ in write_zip(archive, entries):
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,128 @@
+"""Daily sales rollups, per store and day and per store, day and product.
+
+Checkout adds every group of invoices it writes to the rollups inside the
+same transaction (``record_sales``), so sales analytics read one row per day
+(and per product sold that day) instead of scanning invoices. ``rebuild``
+recomputes a store's rollups from its invoices; run it through the
+``rebuild_sales_rollups`` command to backfill, or after invoices were changed
+or deleted outside checkout.
+
+A line's GST is its subtotal at the invoice's rate, rounded to the paisa.
+The per-day GST is the sum of the invoices' own GST amounts, so the two can
+differ by rounding.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Round, TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Invoice, InvoiceItem, Store
+
+PAISA = Decimal('0.01')
+REBUILD_BATCH_SIZE = 2000
+
+
+def gst_on(amount, rate):
+    """GST at ``rate`` percent on ``amount``, rounded to the paisa."""
+    return (amount * Decimal(rate) / 100).quantize(PAISA, ROUND_HALF_UP)
+
+
+def record_sales(store_id, invoices, items):
+    """Add freshly written ``invoices`` and their ``items`` to the rollups."""
+    days = {}
+    for invoice in invoices:
+        row = days.setdefault((store_id, timezone.localdate(invoice.created_at)), [0, 0, 0, 0])
+        row[0] += 1
+        row[1] += invoice.subtotal
+        row[2] += invoice.gst_amount
+        row[3] += invoice.total
+
+    products = {}
+    for item in items:
+        day = timezone.localdate(item.invoice.created_at)
+        row = products.setdefault((store_id, day, item.product_id), [0, 0, 0])
+        subtotal = item.price * item.quantity
+        row[0] += item.quantity
+        row[1] += subtotal
+        row[2] += gst_on(subtotal, item.invoice.gst_percentage)
+
+    _add(DailySales, ('store', 'day'), ('invoices', 'subtotal', 'gst_amount', 'total'), days)
+    _add(DailyProductSales, ('store', 'day', 'product'), ('quantity', 'subtotal', 'gst_amount'), products)
+
+
+def _add(model, key_fields, value_fields, rows):
+    # INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x, which Postgres
+    # and SQLite both speak; bulk_create's upsert can only overwrite.
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    keys = [qn(model._meta.get_field(name).column) for name in key_fields]
+    values = [qn(model._meta.get_field(name).column) for name in value_fields]
+    row = '(%s)' % ', '.join(['%s'] * (len(keys) + len(values)))
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in values)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(keys + values)}) VALUES {', '.join([row] * len(rows))} "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+    params = []
+    for key, totals in rows.items():
+        params.extend(key)
+        params.extend(totals)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def rebuild(store_id):
+    """Recompute ``store_id``'s rollups from its invoices; returns (days, product days)."""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    line_subtotal = ExpressionWrapper(F('price') * F('quantity'), output_field=money)
+
+    with transaction.atomic():
+        # Checkout takes the store row first, so holding it keeps new sales
+        # out of the rollups until the rebuild commits.
+        list(Store.objects.select_for_update().filter(pk=store_id).values_list('pk'))
+        DailySales.objects.filter(store_id=store_id).delete()
+        DailyProductSales.objects.filter(store_id=store_id).delete()
+
+        days = (
+            Invoice.objects.filter(store_id=store_id)
+            .values(day=TruncDate('created_at'))
+            .annotate(
+                invoices=Count('id'),
+                subtotal=Sum('subtotal'),
+                gst_amount=Sum('gst_amount'),
+                total=Sum('total'),
+            )
+            .order_by()
+        )
+        products = (
+            InvoiceItem.objects.filter(invoice__store_id=store_id)
+            .values('product_id', day=TruncDate('invoice__created_at'))
+            .annotate(
+                subtotal=Sum(line_subtotal),
+                gst_amount=Sum(Round(line_subtotal * F('invoice__gst_percentage') / 100, 2), output_field=money),
+                # Last, so the expressions above still see the quantity column.
+                quantity=Sum('quantity'),
+            )
+            .order_by()
+        )
+        return (
+            _insert(DailySales, store_id, days),
+            _insert(DailyProductSales, store_id, products),
+        )
+
+
+def _insert(model, store_id, rows):
+    count = 0
+    batch = []
+    for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        batch.append(model(store_id=store_id, **row))
+        if len(batch) == REBUILD_BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+    return count + len(batch)
@@ -0,0 +1,149 @@
+"""Customer search for the billing screen's customer picker.
+
+Each customer carries ``search_text``, a generated column holding its
+lower-cased name, phone and email, and a query matches anywhere in it.
+
+Names that start with the query come first, read in order from a btree
+index on ``(store_id, search_text)``; when they fill the page nothing else
+runs. Otherwise substring matches follow, from a trigram index: on Postgres
+a GIN index ranked by trigram similarity, on SQLite an FTS5 table using the
+trigram tokenizer ranked by bm25 with the name weighted highest. Only the
+first ``SEARCH_WINDOW`` substring matches are ranked, so a keystroke never
+sorts the store's whole customer table. Trigram indexes need at least three
+characters, so shorter queries fall back to a plain substring scan of the
+store's customers in id order. It stops as soon as the page is full, which a
+one- or two-letter query usually fills quickly; a short query that matches
+little reads the whole store instead.
+
+Postgres indexes come from migration 0015. The SQLite ones, and the triggers
+that keep the FTS5 table in sync, are (re)installed after every migrate by
+``install_sqlite_index``, because SQLite migrations that rebuild the customer
+table drop them.
+"""
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import Collate
+
+from .models import Customer
+
+SQLITE_TABLE = 'accounts_customer_search'
+MIN_TRIGRAM_QUERY = 3
+# Matches ranked per query. A query matching more rows than this is too
+# broad to rank usefully anyway; the next keystroke narrows it.
+SEARCH_WINDOW = 500
+
+
+def search_customers(store, query, limit):
+    """Up to ``limit`` of ``store``'s customers matching ``query``, best first."""
+    query = ' '.join(query.lower().split())
+    if not query:
+        return []
+    customers = Customer.objects.filter(store=store)
+    vendor = connections[customers.db].vendor
+
+    # Names starting with the query rank first; when they alone fill the
+    # page the substring search is skipped.
+    found = list(_prefix_matches(customers, query, vendor)[:limit])
+    if len(found) == limit:
+        return found
+    if len(query) < MIN_TRIGRAM_QUERY:
+        substring = customers.filter(search_text__contains=query).order_by('id')[:limit]
+    else:
+        substring = _substring_matches(store, customers, query, vendor, limit)
+    seen = {customer.pk for customer in found}
+    more = [customer for customer in substring if customer.pk not in seen]
+    return found + more[:limit - len(found)]
+
+
+def _prefix_matches(customers, query, vendor):
+    # A range over the (store_id, search_text) index rather than LIKE: SQLite's
+    # LIKE is case-insensitive and can't use it, and on Postgres byte order
+    # keeps the range exact whatever the database collation.
+    key = Collate('search_text', 'C') if vendor == 'postgresql' else F('search_text')
+    return (
+        customers.alias(key=key)
+        .filter(key__gte=query, key__lt=query + '\U0010ffff')
+        .order_by('key', 'id')
+    )
+
+
+def _substring_matches(store, customers, query, vendor, limit):
+    if vendor == 'postgresql':
+        # search_text is already lower-case, so a plain LIKE keeps the index usable.
+        window = customers.filter(search_text__contains=query).values('pk')[:SEARCH_WINDOW]
+        similarity = Func(F('search_text'), Value(query), function='similarity', output_field=FloatField())
+        return Customer.objects.filter(pk__in=window).order_by(similarity.desc(), 'id')[:limit]
+
+    if vendor == 'sqlite':
+        try:
+            return _search_sqlite(store, query, limit)
+        except OperationalError:
+            # SQLite built without FTS5 or the trigram tokenizer.
+            pass
+    return customers.filter(search_text__contains=query).order_by('id')[:limit]
+
+
+def _search_sqlite(store, query, limit):
+    table = Customer._meta.db_table
+    phrase = '"%s"' % query.replace('"', '""')
+    # bm25 is only computed for the window's rows; the subquery also keeps the
+    # planner from driving the join from the customer table.
+    return list(Customer.objects.raw(
+        f'SELECT c.* FROM ('
+        f'SELECT rowid, bm25({SQLITE_TABLE}, 10.0, 1.0, 1.0) AS score FROM {SQLITE_TABLE} '
+        f'WHERE {SQLITE_TABLE} MATCH %s AND store_id = %s LIMIT %s'
+        f') w JOIN {table} c ON c.id = w.rowid ORDER BY w.score LIMIT %s',
+        [phrase, store.pk, SEARCH_WINDOW, limit],
+    ))
+
+
+def install_sqlite_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the FTS5 customer index and its triggers if they are missing.
+
+    Connected to ``post_migrate``. When the triggers had to be (re)created
+    the index is rebuilt from the customer table, since writes may have been
+    missed while they were gone.
+    """
+    connection = connections[using]
+    table = Customer._meta.db_table
+    if connection.vendor != 'sqlite' or table not in connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5("
+                f"name, phone, email, store_id UNINDEXED, "
+                f"content='{table}', content_rowid='id', tokenize='trigram')"
+            )
+        except OperationalError:
+            return
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS accounts_customer_search_prefix ON {table} (store_id, search_text)'
+        )
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+            [table, f'{SQLITE_TABLE}_%'],
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+
+        insert = (
+            f'INSERT INTO {SQLITE_TABLE}(rowid, name, phone, email, store_id) '
+            f'VALUES (new.id, new.name, new.phone, new.email, new.store_id);'
+        )
+        delete = (
+            f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, name, phone, email, store_id) "
+            f"VALUES ('delete', old.id, old.name, old.phone, old.email, old.store_id);"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_insert AFTER INSERT ON {table} BEGIN {insert} END'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_delete AFTER DELETE ON {table} BEGIN {delete} END'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_update '
+            f'AFTER UPDATE OF name, phone, email, store_id ON {table} BEGIN {delete} {insert} END'
+        )
+        cursor.execute(f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}) VALUES ('rebuild')")
@@ -1,8 +1,71 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import User
+from .tokens import StoreRefreshToken
+from . import checkout
+from .catalog import resolve_skus
 from django.contrib.auth.password_validation import validate_password
-from .models import Store,Product, Customer, Invoice, InvoiceItem
-from decimal import Decimal
+from django.db.models import Prefetch
+from .models import Store,Product, Customer, Invoice, InvoiceItem, StockAlert
+
+
+class EagerLoadingMixin:
+    """Lets a read serializer declare the joins its fields walk.
+
+    ``prefetch_related_fields`` takes plain lookups or ``(lookup, serializer)``
+    pairs; a pair prefetches with the nested serializer's own plan. Views pass
+    their queryset through ``setup_eager_loading`` so a list of any length
+    costs a fixed number of queries. When the client only asked for some
+    ``fields``, joins that none of them walk are left out.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        roots = None
+        if fields is not None:
+            declared = cls().fields
+            roots = {declared[name].source.split('.')[0] for name in fields if name in declared}
+
+        def needed(lookup):
+            return roots is None or lookup.split('__')[0] in roots
+
+        select = [lookup for lookup in cls.select_related_fields if needed(lookup)]
+        if select:
+            queryset = queryset.select_related(*select)
+        for lookup in cls.prefetch_related_fields:
+            if not needed(lookup[0] if isinstance(lookup, tuple) else lookup):
+                continue
+            if isinstance(lookup, tuple):
+                lookup, serializer_class = lookup
+                related = serializer_class.Meta.model._default_manager.all()
+                lookup = Prefetch(lookup, queryset=serializer_class.setup_eager_loading(related))
+            queryset = queryset.prefetch_related(lookup)
+        return queryset
+
+
+class DynamicFieldsMixin:
+    """Trims the output to the comma-separated ``?fields=`` the client asked for."""
+    fields_query_param = 'fields'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        value = request.query_params.get(cls.fields_query_param) if request is not None else None
+        if not value:
+            return None
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class StoreTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = StoreRefreshToken
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -29,16 +92,20 @@ class StoreSerializer(serializers.ModelSerializer):
         model = Store
         fields = ['id', 'name', 'description','address']
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ['id', 'store', 'name', 'phone', 'email']
         read_only_fields = ['id', 'store']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['change_seq']
+
+    def validate_sku(self, value):
+        # Products without a barcode must not collide on ''.
+        return value or None
 
 
 
@@ -122,26 +189,49 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 
-class InvoiceItemReadSerializer(serializers.ModelSerializer):
+class InvoiceItemReadSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     product = serializers.StringRelatedField()
 
+    select_related_fields = ('product',)
+
     class Meta:
         model = InvoiceItem
         fields = ['product', 'quantity', 'price']
 
 
-class InvoiceReadSerializer(serializers.ModelSerializer):
-    store_name = serializers.CharField(source='store.name', read_only=True)
-    store_address = serializers.CharField(source='store.address', read_only=True)
-    store_contact = serializers.CharField(source='store.contact', read_only=True)
+class InvoiceListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """An invoice list row: the bill's totals and snapshot columns only.
 
-    customer_name = serializers.CharField(source='customer.name', read_only=True)
+    Every field is a column of the invoice row itself, covered by the
+    invoice_list index, so a page is read without joins or prefetches. Lines
+    are on InvoiceRetrieveView.
+    """
+
+    class Meta:
+        model = Invoice
+        fields = [
+            'id', 'customer', 'customer_name', 'store_name', 'created_at',
+            'item_count', 'subtotal', 'gst_percentage', 'gst_amount', 'total'
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        # Nothing to join; load just the indexed columns, plus created_at
+        # for the page cursor.
+        columns = [name for name in fields or () if name in cls.Meta.fields] or cls.Meta.fields
+        return queryset.only('created_at', *columns)
+
+
+class InvoiceReadSerializer(DynamicFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     gst_percentage = serializers.DecimalField(max_digits=5, decimal_places=2)
     gst_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2)
     total = serializers.DecimalField(max_digits=10, decimal_places=2)
     items = InvoiceItemReadSerializer(many=True, read_only=True)
 
+    prefetch_related_fields = (('items', InvoiceItemReadSerializer),)
+
     class Meta:
         model = Invoice
         fields = [
@@ -150,85 +240,180 @@ class InvoiceReadSerializer(serializers.ModelSerializer):
             'gst_amount', 'total', 'items'
         ]
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that can resolve a whole batch of pks in one query.
+
+    Preloaded rows live in the serializer context, so every serializer sharing
+    a context (one per invoice of a bulk upload) shares the lookups too. With
+    a request in the context, only rows of the requesting user's store resolve.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is not None:
+            queryset = queryset.filter(store=request.user.store)
+        return queryset
+
+    def preloaded(self):
+        return self.context.setdefault('preloaded', {}).setdefault(self.queryset.model, {})
+
+    def preload(self, pks):
+        cache = self.preloaded()
+        missing = set()
+        for pk in pks:
+            try:
+                pk = int(pk)
+            except (TypeError, ValueError):
+                continue
+            if pk not in cache:
+                missing.add(pk)
+        if missing:
+            found = self.get_queryset().in_bulk(missing)
+            for pk in missing:
+                cache[pk] = found.get(pk)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        cache = self.preloaded()
+        if pk not in cache:
+            return super().to_internal_value(data)
+        if cache[pk] is None:
+            self.fail('does_not_exist', pk_value=data)
+        return cache[pk]
+
+
+def preload_skus(context, skus):
+    # SKU -> product id (None if unknown) for the requesting store, kept in
+    # the context next to the preloaded rows.
+    known = context.setdefault('skus', {})
+    new = {sku for sku in skus if isinstance(sku, str) and sku not in known}
+    if new:
+        found = resolve_skus(context['request'].user.store.pk, new)
+        for sku in new:
+            known[sku] = found.get(sku)
+    return known
+
+
+class InvoiceItemListSerializer(serializers.ListSerializer):
+    # Resolve every product on the bill up front instead of one query per line.
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            lines = [item for item in data if isinstance(item, dict)]
+            self.child.fields['product'].preload([item.get('product') for item in lines if 'product' in item])
+            preload_skus(self.context, [item.get('sku') for item in lines if 'sku' in item])
+        return super().to_internal_value(data)
+
+
 class InvoiceItemWriteSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    product = PreloadedPrimaryKeyRelatedField(queryset=Product.objects.all(), required=False)
+    sku = serializers.CharField(max_length=64, write_only=True, required=False)
 
     class Meta:
         model = InvoiceItem
-        fields = ['product', 'quantity']
+        fields = ['product', 'sku', 'quantity']
+        list_serializer_class = InvoiceItemListSerializer
+
+    def validate(self, attrs):
+        # A line names its product by id or by scanned SKU.
+        if 'sku' not in attrs:
+            if 'product' not in attrs:
+                raise serializers.ValidationError({'product': 'This field is required if sku is not provided.'})
+            return attrs
+        if 'product' in attrs:
+            raise serializers.ValidationError('Provide either product or sku, not both.')
+        product_id = preload_skus(self.context, [attrs['sku']])[attrs['sku']]
+        if product_id is None:
+            raise serializers.ValidationError({'sku': f"Unknown SKU {attrs['sku']}."})
+        # Checkout locks and re-reads the row, checking the SKU still matches.
+        attrs['product'] = Product(pk=product_id, sku=attrs['sku'])
+        return attrs
+
+
+class NewCustomerSerializer(serializers.ModelSerializer):
+    """A customer added at the till along with their first bill."""
+
+    class Meta:
+        model = Customer
+        fields = ['name', 'phone', 'email', 'address']
 
 
 class InvoiceCreateSerializer(serializers.ModelSerializer):
     items = InvoiceItemWriteSerializer(many=True)
-    new_customer = serializers.DictField(write_only=True, required=False)
-    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all(), required=False)
+    new_customer = NewCustomerSerializer(write_only=True, required=False)
+    customer = PreloadedPrimaryKeyRelatedField(queryset=Customer.objects.all(), required=False)
 
     class Meta:
         model = Invoice
         fields = [
             'id', 'store', 'customer', 'new_customer',
             'created_at', 'gst_percentage', 'subtotal',
-            'gst_amount', 'total', 'items'
+            'gst_amount', 'total', 'items', 'idempotency_key'
         ]
         read_only_fields = ['subtotal', 'gst_amount', 'total', 'store', 'created_at']
+        extra_kwargs = {'idempotency_key': {'write_only': True}}
+
+    @classmethod
+    def preload(cls, context, invoices):
+        """Resolve the products, SKUs and customers of many invoices in one query each."""
+        fields = cls(context=context).fields
+        products, skus, customers = [], [], []
+        for invoice in invoices:
+            if not isinstance(invoice, dict):
+                continue
+            customers.append(invoice.get('customer'))
+            items = invoice.get('items')
+            if isinstance(items, list):
+                for item in items:
+                    if isinstance(item, dict):
+                        products.append(item.get('product'))
+                        skus.append(item.get('sku'))
+        fields['items'].child.fields['product'].preload(products)
+        fields['customer'].preload(customers)
+        preload_skus(context, skus)
 
     def create(self, validated_data):
         request = self.context['request']
         store = request.user.store
-        items_data = validated_data.pop('items')
-        new_customer_data = validated_data.pop('new_customer', None)
-
-        if new_customer_data:
-            customer = Customer.objects.create(store=store, **new_customer_data)
-        else:
-            customer = validated_data.get('customer')
-            if not customer:
-                raise serializers.ValidationError({'customer': 'This field is required if new_customer is not provided.'})
 
-        gst_percentage = validated_data.get('gst_percentage', 18)
-        invoice = Invoice.objects.create(
-            store=store,
-            customer=customer,
-            gst_percentage=gst_percentage
-        )
+        if not validated_data.get('new_customer') and not validated_data.get('customer'):
+            raise serializers.ValidationError({'customer': 'This field is required if new_customer is not provided.'})
 
-        subtotal = 0
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-            price = product.price
+        [(status, result)] = checkout.with_retries(checkout.place_invoices, store, [validated_data])
+        if status == checkout.REJECTED:
+            raise serializers.ValidationError(result)
+        return result
 
-            if product.stock < quantity:
-                raise serializers.ValidationError(f"Not enough stock for {product.name}")
 
-            product.stock -= quantity
-            product.save()
+class InvoiceIngestSerializer(InvoiceCreateSerializer):
+    """One invoice of an offline upload; these must carry an idempotency key."""
+    idempotency_key = serializers.CharField(max_length=64, write_only=True)
 
-            InvoiceItem.objects.create(
-                invoice=invoice,
-                product=product,
-                quantity=quantity,
-                price=price
-            )
-            subtotal += price * quantity
-
-        gst_amount = subtotal * (Decimal(gst_percentage) / Decimal('100'))
-        total = subtotal + gst_amount
+    def validate(self, attrs):
+        if not attrs.get('new_customer') and not attrs.get('customer'):
+            raise serializers.ValidationError({'customer': 'This field is required if new_customer is not provided.'})
+        return attrs
 
-        invoice.subtotal = subtotal
-        invoice.gst_amount = gst_amount
-        invoice.total = total
-        invoice.save()
 
-        return invoice
+class InvoiceIngestResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Invoice
+        fields = ['id', 'customer', 'created_at', 'subtotal', 'gst_amount', 'total']
 
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     store = StoreSerializer(read_only=True)
     customer_name = serializers.CharField(source='customer.name', read_only=True)
     items = InvoiceItemReadSerializer(many=True, read_only=True)
 
+    prefetch_related_fields = (('items', InvoiceItemReadSerializer),)
+
     class Meta:
         model = Invoice
         fields = [
@@ -237,16 +422,20 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'items'
         ]
 
-class StoreBasicSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Store
-        fields = ['name', 'address', 'contact']
+class InvoiceStoreSerializer(serializers.Serializer):
+    """The store as it was on the bill, from the invoice's snapshot columns."""
+    name = serializers.CharField(source='store_name')
+    address = serializers.CharField(source='store_address')
+    contact = serializers.CharField(source='store_contact', allow_null=True)
 
 
-class InvoiceDetailSerializer(serializers.ModelSerializer):
+class InvoiceDetailSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    # Names come from the invoice's snapshot, so a bill (and its PDF, cached
+    # by the rendered HTML) never changes when the store or customer does.
     items = InvoiceItemReadSerializer(many=True)
-    customer_name = serializers.SerializerMethodField()
-    store = StoreBasicSerializer(read_only=True)
+    store = InvoiceStoreSerializer(source='*', read_only=True)
+
+    prefetch_related_fields = (('items', InvoiceItemReadSerializer),)
 
     class Meta:
         model = Invoice
@@ -256,5 +445,29 @@ class InvoiceDetailSerializer(serializers.ModelSerializer):
             'total', 'items'
         ]
 
-    def get_customer_name(self, obj):
-        return obj.customer.name
\ No newline at end of file
+
+class SalesTotalsSerializer(serializers.Serializer):
+    invoices = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    gst_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class SalesBucketSerializer(SalesTotalsSerializer):
+    start = serializers.DateField()
+
+
+class TopProductSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    gst_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = ['id', 'product', 'product_name', 'stock', 'reorder_level', 'created_at']
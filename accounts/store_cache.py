@@ -0,0 +1,73 @@
+"""Per-worker cache of each user's Store.
+
+Nearly every view is scoped by ``request.user.store``, which costs a query on
+top of loading the user. ``StoreCache`` keeps a bounded LRU of Store rows by
+user id so the authentication class can hand the store over already loaded.
+
+Saving or deleting a Store drops its entry, but only in the worker that did
+it; entries also expire after ``STORE_CACHE_TTL`` seconds, which bounds how
+long other workers can serve a stale copy. Views that display the store
+profile read it fresh.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Store
+
+
+class StoreCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return a private copy of the user's store, or raise Store.DoesNotExist."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return copy.copy(entry[0])
+
+        store = Store.objects.get(user_id=user_id)
+        with self._lock:
+            self._entries[user_id] = (store, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return copy.copy(store)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+store_cache = StoreCache(settings.STORE_CACHE_SIZE, settings.STORE_CACHE_TTL)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        store_cache.invalidate(instance.user_id)
+
+
+def attach_store(user):
+    """Prime ``user.store`` from the cache; users without a store are left alone."""
+    try:
+        user.store = store_cache.get(user.pk)
+    except Store.DoesNotExist:
+        pass
+    return user
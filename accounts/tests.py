@@ -1,3 +1,1140 @@
-from django.test import TestCase
+import datetime
+import functools
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import checkout, pdf, rollups
+from .authentication import StatelessStoreJWTAuthentication, StoreJWTAuthentication
+from .catalog import sku_cache
+from .instrumentation import InstrumentationMiddleware, Registry, fold_exited, merge, read_snapshots
+from .models import User, Store, Product, Customer, Invoice, InvoiceItem, StockAlert, DailySales
+from .store_cache import store_cache
+from .tokens import StoreRefreshToken
+
+
+class InvoiceCheckoutConcurrencyTests(TransactionTestCase):
+    tills = 12
+    stock = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        self.product = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=self.stock)
+
+    def sell(self, barrier, results):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {
+            'customer': self.customer.id,
+            'items': [{'product': self.product.id, 'quantity': 1}],
+        }
+        try:
+            barrier.wait()
+            response = client.post('/api/auth/invoice/create/', payload, format='json')
+            results.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_parallel_sales_of_the_same_sku_never_oversell(self):
+        barrier = threading.Barrier(self.tills)
+        results = []
+        threads = [threading.Thread(target=self.sell, args=(barrier, results)) for _ in range(self.tills)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        sold = results.count(201)
+        self.assertEqual(len(results), self.tills)
+        self.assertEqual(sorted(set(results) - {201, 400}), [])
+        self.assertEqual(sold, self.stock)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Invoice.objects.count(), sold)
+        self.assertEqual(InvoiceItem.objects.filter(product=self.product).count(), sold)
+
+    def test_shortfall_on_a_later_line_leaves_nothing_behind(self):
+        bread = Product.objects.create(store=self.store, name='Bread', price='20.00', stock=1)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/auth/invoice/create/', {
+            'new_customer': {'name': 'New'},
+            'items': [
+                {'product': self.product.id, 'quantity': 2},
+                {'product': bread.id, 'quantity': 3},
+            ],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, self.stock)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(Customer.objects.filter(name='New').exists())
+
+    def test_invoice_keeps_the_names_it_was_billed_under(self):
+        bread = Product.objects.create(store=self.store, name='Bread', price='20.00', stock=1)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/auth/invoice/create/', {
+            'customer': self.customer.id,
+            'items': [
+                {'product': self.product.id, 'quantity': 2},
+                {'product': bread.id, 'quantity': 1},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        Store.objects.filter(pk=self.store.pk).update(name='Renamed')
+        Customer.objects.filter(pk=self.customer.pk).update(name='Renamed')
+        [row] = client.get('/api/auth/invoices/').data
+        self.assertEqual(row['store_name'], 'Corner Shop')
+        self.assertEqual(row['customer_name'], 'Walk-in')
+        self.assertEqual(row['item_count'], 2)
+        self.assertEqual(row['total'], '94.40')
+
+        detail = client.get(f"/api/auth/invoices/{row['id']}/").data
+        self.assertEqual(detail['customer_name'], 'Walk-in')
+        self.assertEqual(detail['store']['name'], 'Corner Shop')
+        with mock.patch('accounts.pdf.lookup', return_value=None), mock.patch('accounts.pdf.schedule') as schedule:
+            self.assertEqual(client.get(f"/api/auth/invoices/{row['id']}/pdf/").status_code, 202)
+        [(_, html)] = pdf.invoice_html(Invoice.objects.all())
+        self.assertEqual(schedule.call_args.args[1], html)
+        self.assertIn('Walk-in', html)
+        self.assertNotIn('Renamed', html)
+
+
+class CheckoutRetryTests(SimpleTestCase):
+    def fail_then_succeed(self, sqlstate, failures=2):
+        # What Django raises for a psycopg 3 error: the driver's error as __cause__.
+        calls = []
+
+        def place():
+            calls.append(1)
+            if len(calls) <= failures:
+                cause = type('DriverError', (Exception,), {'sqlstate': sqlstate})()
+                raise OperationalError('canceling statement') from cause
+            return 'placed'
+        return place, calls
+
+    def test_lock_timeouts_and_deadlocks_are_retried(self):
+        for sqlstate in ('40P01', '55P03', '40001'):
+            place, calls = self.fail_then_succeed(sqlstate)
+            with mock.patch('accounts.checkout.time.sleep'):
+                self.assertEqual(checkout.with_retries(place), 'placed')
+            self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not(self):
+        place, calls = self.fail_then_succeed('53300')
+        with self.assertRaises(OperationalError):
+            checkout.with_retries(place)
+        self.assertEqual(len(calls), 1)
+
+
+class InvoiceReadQueryBudgetTests(TestCase):
+    """Invoice read endpoints cost the same number of queries at any size."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def seed(self, invoices, lines):
+        products = [
+            Product.objects.create(store=self.store, name=f'Product {i}', price='10.00', stock=1000)
+            for i in range(lines)
+        ]
+        for i in range(invoices):
+            customer = Customer.objects.create(store=self.store, name=f'Customer {i}')
+            invoice = Invoice.objects.create(store=self.store, customer=customer)
+            InvoiceItem.objects.bulk_create([
+                InvoiceItem(invoice=invoice, product=product, quantity=1, price=product.price)
+                for product in products
+            ])
+        return invoice
+
+    def refresh_user(self):
+        # Drop the cached store so every request pays for resolving it.
+        self.user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(self.user)
+
+    def test_invoice_list_budget_is_flat(self):
+        for invoices, lines in ((1, 1), (25, 8)):
+            self.seed(invoices, lines)
+            self.refresh_user()
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/auth/invoices/')
+            self.assertEqual(response.status_code, 200)
+
+    def test_invoice_retrieve_budget_is_flat(self):
+        for lines in (1, 20):
+            invoice = self.seed(1, lines)
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/auth/invoices/{invoice.pk}/')
+            self.assertEqual(len(response.data['items']), lines)
+
+    def test_invoice_retrieve_is_scoped_to_the_store(self):
+        invoice = self.seed(1, 1)
+        other = User.objects.create_user(username='other', password='pass')
+        Store.objects.create(user=other, name='Other Shop')
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(client.get(f'/api/auth/invoices/{invoice.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/auth/invoices/{invoice.pk}/').status_code, 200)
+
+    def test_invoice_pdf_budget_is_flat(self):
+        from .views import InvoicePDFView
+
+        factory = APIRequestFactory()
+        for lines in (1, 20):
+            invoice = self.seed(1, lines)
+            self.refresh_user()
+            request = factory.get(f'/invoices/{invoice.pk}/pdf/')
+            force_authenticate(request, user=self.user)
+            with mock.patch('accounts.pdf.schedule') as schedule, self.assertNumQueries(3):
+                response = InvoicePDFView.as_view()(request, pk=invoice.pk)
+            self.assertEqual(response.status_code, 202)
+            schedule.assert_called_once()
+
+
+class InvoiceCreateQueryBudgetTests(TestCase):
+    """Checkout costs the same number of queries however many lines it has."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        self.products = [
+            Product.objects.create(store=self.store, name=f'Product {i}', price='10.00', stock=100)
+            for i in range(40)
+        ]
+        self.client = APIClient()
+
+    def create(self, lines):
+        # A fresh user each time so every request pays for resolving the store.
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/auth/invoice/create/', {
+                'customer': self.customer.id,
+                'items': [{'product': product.id, 'quantity': 1} for product in self.products[:lines]],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(queries)
+
+    def test_invoice_create_budget_is_flat(self):
+        one = self.create(1)
+        self.assertEqual([self.create(lines) for lines in (10, 40)], [one, one])
+        self.assertEqual(InvoiceItem.objects.count(), 51)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 97)
+        self.assertEqual(Product.objects.get(pk=self.products[39].pk).stock, 99)
+
+
+class InvoicePaginationTests(TestCase):
+    """Keyset pages walk the invoice list exactly once, ties and all."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(store=self.store, name='Walk-in')
+        invoices = Invoice.objects.bulk_create(Invoice(store=self.store, customer=customer) for _ in range(7))
+        # Several bills in the same instant, so paging has to break ties on id.
+        now = timezone.now()
+        for i, invoice in enumerate(invoices):
+            invoice.created_at = now - datetime.timedelta(minutes=i // 3)
+        Invoice.objects.bulk_update(invoices, ['created_at'])
+        self.expected = list(Invoice.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_pages_follow_created_at_then_id(self):
+        seen = []
+        url = '/api/auth/invoices/?page_size=2&fields=id,total'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for row in response.data['results']:
+                self.assertEqual(set(row), {'id', 'total'})
+                seen.append(row['id'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_unpaged_list_and_bad_cursor(self):
+        response = self.client.get('/api/auth/invoices/')
+        self.assertEqual(sorted(row['id'] for row in response.data), sorted(self.expected))
+        self.assertEqual(self.client.get('/api/auth/invoices/?cursor=garbage').status_code, 404)
+
+
+class InvoiceExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(store=self.store, name='Walk-in')
+        product = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        now = timezone.now()
+        for days in (0, 1, 40):
+            invoice = Invoice.objects.create(store=self.store, customer=customer, customer_name='Walk-in', total=days)
+            Invoice.objects.filter(pk=invoice.pk).update(created_at=now - datetime.timedelta(days=days))
+            InvoiceItem.objects.create(invoice=invoice, product=product, quantity=2, price='30.00')
+        self.month = f'from={timezone.localdate() - datetime.timedelta(days=30)}&to={timezone.localdate()}'
+
+    def export(self, query):
+        response = self.client.get(f'/api/auth/invoices/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_and_json_carry_the_same_rows(self):
+        response, body = self.export(self.month)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        # Oldest first, and the bill from 40 days ago is out of range.
+        self.assertEqual([row['total'] for row in rows], ['1.00', '0.00'])
+        self.assertEqual(rows[0]['customer_name'], 'Walk-in')
+        self.assertEqual(rows[0]['items'], [{'product': 'Milk', 'quantity': 2, 'price': '30.00'}])
+
+        _, body = self.export(f'{self.month}&output=json')
+        self.assertEqual(json.loads(body), rows)
+        _, body = self.export('output=json&from=2000-01-01&to=2000-01-02')
+        self.assertEqual(json.loads(body), [])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/auth/invoices/export/?from=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/auth/invoices/export/?output=xml').status_code, 400)
+
+
+class InvoicePDFTests(TestCase):
+    """The PDF cache and render queue, with WeasyPrint stubbed out.
+
+    Renders run on a one-thread pool, so ``drain()`` returning means every
+    render queued so far has finished and its done-callback has run.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        product = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        self.invoice = Invoice.objects.create(store=self.store, customer=self.customer, customer_name='Walk-in')
+        InvoiceItem.objects.create(invoice=self.invoice, product=product, quantity=2, price='30.00')
+
+        self.enterContext(override_settings(INVOICE_PDF_CACHE_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        self.enterContext(mock.patch.object(pdf, '_executor', self.executor))
+        self.enterContext(mock.patch.dict(pdf._pending, clear=True))
+        self.enterContext(mock.patch.object(pdf, 'render_to_file', self.render))
+        self.renders = []
+        self.failures = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def render(self, html_string, path):
+        self.gate.wait(5)
+        self.renders.append(html_string)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('WeasyPrint fell over')
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'%PDF ' + html_string.encode())
+        return str(path)
+
+    def drain(self):
+        self.executor.submit(int).result()
+
+    def get(self):
+        return self.client.get(f'/api/auth/invoices/{self.invoice.pk}/pdf/')
+
+    def html(self):
+        [(_, html)] = pdf.invoice_html(Invoice.objects.filter(pk=self.invoice.pk))
+        return html
+
+    def test_miss_queues_a_render_and_hit_serves_the_file(self):
+        key = pdf.cache_key(self.html())
+        response = self.get()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '1')
+        self.drain()
+        self.assertEqual(pdf.lookup(key), pdf.cache_path(key))
+        self.assertEqual(pdf._pending, {})
+
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], f'"{key}"')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF ' + self.html().encode())
+        response.close()
+        self.assertEqual(len(self.renders), 1)
+
+    def test_concurrent_misses_share_one_render(self):
+        self.gate.clear()
+        html = self.html()
+        key = pdf.cache_key(html)
+        first = pdf.schedule(key, html)
+        self.assertIs(pdf.schedule(key, html), first)
+        self.assertEqual(self.get().status_code, 202)
+        self.assertIs(pdf._pending[key], first)
+        self.gate.set()
+        first.result(5)
+        self.drain()
+        self.assertEqual(len(self.renders), 1)
+
+    def test_failed_render_is_logged_once_then_requeued(self):
+        self.failures = 1
+        with self.assertLogs('accounts.pdf', 'ERROR') as logs:
+            self.assertEqual(self.get().status_code, 202)
+            self.drain()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsInstance(logs.records[0].exc_info[1], RuntimeError)
+        self.assertEqual(pdf._pending, {})
+
+        # The next poll is not blamed for the failure; it just queues a retry.
+        self.assertEqual(self.get().status_code, 202)
+        self.drain()
+        self.assertEqual(len(self.renders), 2)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_broken_pool_is_replaced(self):
+        broken = mock.Mock(submit=mock.Mock(side_effect=BrokenProcessPool('worker died')))
+        with mock.patch.object(pdf, '_executor', broken), \
+                mock.patch.object(pdf, 'make_executor', return_value=self.executor) as make_executor:
+            self.assertEqual(self.get().status_code, 202)
+            broken.shutdown.assert_called_once_with(wait=False)
+            make_executor.assert_called_once()
+            self.assertIs(pdf._executor, self.executor)
+        self.drain()
+        self.assertEqual(self.get().status_code, 200)
+
+    def add_invoices(self, *days_ago):
+        invoices = []
+        for days in days_ago:
+            invoice = Invoice.objects.create(store=self.store, customer=self.customer, customer_name=f'Customer {days}')
+            Invoice.objects.filter(pk=invoice.pk).update(created_at=timezone.now() - datetime.timedelta(days=days))
+            invoices.append(invoice)
+        return invoices
+
+    def members(self, invoices):
+        return {name: b'%PDF ' + html.encode() for name, html in pdf.invoice_html(
+            Invoice.objects.filter(pk__in=[invoice.pk for invoice in invoices]))}
+
+    def batch(self, query):
+        response = self.client.get(f'/api/auth/invoices/pdf/batch/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    def test_batch_zips_the_requested_invoices(self):
+        old, recent = self.add_invoices(40, 1)
+        # One PDF is already cached; the others are rendered for the batch.
+        self.get()
+        self.drain()
+        self.assertEqual(self.batch(f'ids={old.pk},{self.invoice.pk}'), self.members([old, self.invoice]))
+        self.assertEqual(len(self.renders), 2)
+
+        today = timezone.localdate()
+        self.assertEqual(self.batch(f'from={today - datetime.timedelta(days=7)}&to={today}'),
+                         self.members([recent, self.invoice]))
+
+    def test_batch_leaves_failed_renders_out_and_lists_them(self):
+        old, recent = self.add_invoices(2, 1)
+        self.failures = 1
+        with self.assertLogs('accounts.pdf', 'ERROR'):
+            files = self.batch(f'ids={old.pk},{recent.pk}')
+        errors = files.pop(pdf.ERRORS_MEMBER).decode()
+        self.assertEqual(errors, f'invoice_{old.pk}.pdf: RuntimeError: WeasyPrint fell over\n')
+        self.assertEqual(files, self.members([recent]))
+
+    def test_batch_rejects_bad_and_oversized_requests(self):
+        self.add_invoices(1, 2)
+        self.assertEqual(self.client.get('/api/auth/invoices/pdf/batch/?ids=1,x').status_code, 400)
+        self.assertEqual(self.client.get('/api/auth/invoices/pdf/batch/?from=yesterday').status_code, 400)
+        with override_settings(INVOICE_PDF_BATCH_LIMIT=2):
+            response = self.client.get('/api/auth/invoices/pdf/batch/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'At most 2 invoices per batch.'})
+        self.assertEqual(self.renders, [])
+
+    def test_export_command_writes_the_zip_and_reports_failures(self):
+        old, recent = self.add_invoices(2, 1)
+        output = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'invoices.zip'
+        ids = f'{old.pk},{recent.pk}'
+        export = functools.partial(call_command, 'export_invoice_pdfs', store=self.store.pk, ids=ids, output=output,
+                                   stdout=io.StringIO(), stderr=io.StringIO())
+        self.failures = 1
+        with mock.patch.object(pdf, 'make_executor', lambda workers: ThreadPoolExecutor(max_workers=1)):
+            with self.assertLogs('accounts.pdf', 'ERROR'), self.assertRaisesMessage(CommandError, '1 invoices failed'):
+                export()
+            with zipfile.ZipFile(output) as archive:
+                self.assertEqual(archive.namelist(), [f'invoice_{recent.pk}.pdf', pdf.ERRORS_MEMBER])
+
+            # A second run picks up the cached PDF and renders the one that failed.
+            export()
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual({name: archive.read(name) for name in archive.namelist()}, self.members([old, recent]))
+        self.assertEqual(len(self.renders), 3)
+
+
+class StatelessAuthenticationTests(TestCase):
+    """JWT_AUTH_MODE=stateless: users come from token claims, not the User table."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        self.factory = APIRequestFactory()
+
+    def request(self, view, user, method='get', data=None, token=None):
+        token = token or StoreRefreshToken.for_user(user).access_token
+        request = getattr(self.factory, method)('/', data, format='json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return view.as_view(authentication_classes=[StatelessStoreJWTAuthentication])(request)
+
+    def authenticate(self, user):
+        token = StoreRefreshToken.for_user(user).access_token
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return StatelessStoreJWTAuthentication().authenticate(request)[0]
+
+    def test_store_comes_from_the_token(self):
+        from .views import ProductListView
+
+        user = self.authenticate(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.store.pk, self.store.pk)
+        response = self.request(ProductListView, self.user)
+        self.assertEqual([row['name'] for row in response.data], ['Milk'])
+
+    def test_user_without_a_store(self):
+        from .views import CustomerCreateView
+
+        other = User.objects.create_user(username='other', password='pass')
+        user = self.authenticate(other)
+        self.assertFalse(hasattr(user, 'store'))
+        self.assertIsNone(getattr(user, 'store', None))
+        response = self.request(CustomerCreateView, other, 'post', {'name': 'Asha'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_changed_password_revokes_tokens(self):
+        from .views import ProductListView
+
+        token = StoreRefreshToken.for_user(self.user).access_token
+        self.user.set_password('new-pass')
+        self.user.save()
+        self.assertEqual(self.request(ProductListView, self.user, token=token).status_code, 401)
+        self.assertEqual(self.request(ProductListView, self.user).status_code, 200)
+
+
+class StoreCacheTests(TestCase):
+    """The default JWT mode hands views a cached ``request.user.store``."""
+
+    def setUp(self):
+        store_cache.clear()
+        self.addCleanup(store_cache.clear)
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.token = StoreRefreshToken.for_user(self.user).access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        with CaptureQueriesContext(connection) as queries:
+            user = StoreJWTAuthentication().authenticate(request)[0]
+            name = user.store.name
+        return name, [query['sql'] for query in queries if 'accounts_store' in query['sql']]
+
+    def test_second_request_reuses_the_store(self):
+        self.assertEqual(len(self.authenticate()[1]), 1)
+        self.assertEqual(self.authenticate(), ('Corner Shop', []))
+
+    def test_store_update_is_seen_by_the_next_request(self):
+        self.authenticate()
+        response = self.client.put('/api/auth/store/', {'name': 'Corner Shop & Co'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.authenticate()[0], 'Corner Shop & Co')
+        self.assertEqual(self.client.get('/api/auth/store/').data['name'], 'Corner Shop & Co')
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch('accounts.store_cache.time.monotonic', return_value=1000.0) as clock:
+            self.authenticate()
+            # Renamed by another worker: no signal reaches this one's cache.
+            Store.objects.filter(pk=self.store.pk).update(name='Renamed')
+            clock.return_value += settings.STORE_CACHE_TTL - 1
+            self.assertEqual(self.authenticate(), ('Corner Shop', []))
+            clock.return_value += 2
+            name, queries = self.authenticate()
+        self.assertEqual(name, 'Renamed')
+        self.assertEqual(len(queries), 1)
+
+
+class CatalogSyncTests(TestCase):
+    """What a polling till sees of catalog changes: ETags and the delta feed."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.milk = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def etag(self):
+        response = self.client.get('/api/auth/products/')
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_catalog_is_not_modified(self):
+        etag = self.etag()
+        response = self.client.get('/api/auth/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Another representation of the same catalog has its own tag.
+        self.assertNotEqual(self.client.get('/api/auth/products/?fields=id')['ETag'], etag)
+
+        self.milk.price = '32.00'
+        self.milk.save()
+        edited = self.client.get('/api/auth/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(edited.status_code, 200)
+        self.assertEqual(edited.data[0]['price'], '32.00')
+
+        response = self.client.post('/api/auth/invoice/create/', {
+            'customer': self.customer.pk, 'items': [{'product': self.milk.pk, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        sold = self.client.get('/api/auth/products/', HTTP_IF_NONE_MATCH=edited['ETag'])
+        self.assertEqual(sold.status_code, 200)
+        self.assertEqual(sold.data[0]['stock'], 4)
+
+    def test_delta_sync_returns_changes_and_tombstones(self):
+        start = self.client.get('/api/auth/sync/').data
+        self.assertEqual([row['name'] for row in start['products']], ['Milk'])
+        self.assertEqual([row['name'] for row in start['customers']], ['Walk-in'])
+
+        bread = Product.objects.create(store=self.store, name='Bread', price='20.00', stock=5)
+        self.milk.stock = 9
+        self.milk.save()
+        customer_id = self.customer.pk
+        self.customer.delete()
+        changes = self.client.get(f"/api/auth/sync/?since={start['cursor']}").data
+        self.assertEqual({row['id']: row['stock'] for row in changes['products']}, {bread.pk: 5, self.milk.pk: 9})
+        self.assertEqual(changes['customers'], [])
+        self.assertEqual(changes['deleted'], {'products': [], 'customers': [customer_id]})
+        self.assertFalse(changes['has_more'])
+
+        # The deletion was the last change; the cursor after it is a clean stop.
+        after = self.client.get(f"/api/auth/sync/?since={changes['cursor']}").data
+        self.assertEqual(after['cursor'], changes['cursor'])
+        self.assertEqual((after['products'], after['customers']), ([], []))
+        self.assertEqual(after['deleted'], {'products': [], 'customers': []})
+
+        first = self.client.get(f"/api/auth/sync/?since={start['cursor']}&limit=1").data
+        self.assertTrue(first['has_more'])
+        self.assertEqual([row['id'] for row in first['products']], [bread.pk])
+
+
+class InvoiceBulkIngestTests(TestCase):
+    """Offline uploads: idempotent, and per-invoice in what they accept."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.milk = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, key, quantity=1, **kwargs):
+        return {
+            'idempotency_key': key, 'items': [{'product': self.milk.pk, 'quantity': quantity}],
+            **(kwargs or {'customer': self.customer.pk}),
+        }
+
+    def upload(self, *orders):
+        response = self.client.post('/api/auth/invoices/bulk/', {'invoices': list(orders)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [line['status'] for line in response.data['results']]
+
+    def counters(self):
+        return Store.objects.filter(pk=self.store.pk).values_list('change_seq', 'catalog_version').get()
+
+    def test_replays_and_rejections_leave_the_catalog_version_alone(self):
+        self.assertEqual(self.upload(self.order('a'), self.order('b')), ['created', 'created'])
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.stock, 3)
+        counters = self.counters()
+        etag = self.client.get('/api/auth/products/')['ETag']
+
+        self.assertEqual(self.upload(self.order('a'), self.order('c', quantity=50)), ['replayed', 'rejected'])
+        self.assertEqual(self.counters(), counters)
+        self.assertEqual(self.client.get('/api/auth/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_new_customers_are_validated(self):
+        too_long = {'name': 'Asha', 'phone': '9' * 30}
+        statuses = self.upload(
+            self.order('a', new_customer={'name': 'Ravi', 'bogus': 1}),
+            self.order('b', new_customer=too_long),
+            self.order('c', new_customer={'phone': '98450'}),
+        )
+        self.assertEqual(statuses, ['created', 'rejected', 'rejected'])
+        self.assertEqual(list(Invoice.objects.values_list('customer_name', flat=True)), ['Ravi'])
+
+        for new_customer in (too_long, {'phone': '98450'}, 'Asha'):
+            response = self.client.post('/api/auth/invoice/create/', {
+                'new_customer': new_customer, 'items': [{'product': self.milk.pk, 'quantity': 1}],
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('new_customer', response.data)
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class SkuCheckoutTests(TestCase):
+    def setUp(self):
+        sku_cache.clear()
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.milk = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5, sku='890100')
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bill(self, *skus):
+        return self.client.post('/api/auth/invoice/create/', {
+            'customer': self.customer.pk, 'items': [{'sku': sku, 'quantity': 1} for sku in skus],
+        }, format='json')
+
+    def test_scanned_basket_bills_by_sku(self):
+        self.assertEqual(self.client.get('/api/auth/products/scan/890100/').data['name'], 'Milk')
+        self.assertEqual(self.client.get('/api/auth/products/scan/000000/').status_code, 404)
+        response = self.bill('890100', '890100')
+        self.assertEqual(response.status_code, 201)
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.stock, 3)
+        self.assertIn('sku', self.bill('000000').data['items'][0])
+
+    def test_stale_cached_sku_is_rejected(self):
+        self.client.get('/api/auth/products/scan/890100/')
+        # Re-labelled by another worker: this worker's cache still has the old SKU.
+        Product.objects.filter(pk=self.milk.pk).update(sku='890200')
+        response = self.bill('890100')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown product 890100', str(response.data))
+        self.assertFalse(Invoice.objects.exists())
+        # The bad entry is gone, so the next scan of the old label is a plain miss.
+        self.assertIn('sku', self.bill('890100').data['items'][0])
+
+
+class SalesReportTests(TestCase):
+    """Analytics and GST reports over bills rung up through checkout."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.milk = Product.objects.create(store=self.store, name='Milk', price='33.33', stock=50)
+        self.bread = Product.objects.create(store=self.store, name='Bread', price='10.05', stock=50)
+        self.customer = Customer.objects.create(store=self.store, name='Walk-in')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # 33.33 at 18% is 6.00 of GST; 66.66 + 10.05 at 5% is 3.84 on the
+        # bill but 3.33 + 0.50 over its lines.
+        self.bill({self.milk: 1}, 18)
+        self.bill({self.milk: 2, self.bread: 1}, 5)
+
+    def bill(self, lines, rate):
+        response = self.client.post('/api/auth/invoice/create/', {
+            'customer': self.customer.pk, 'gst_percentage': rate,
+            'items': [{'product': product.pk, 'quantity': quantity} for product, quantity in lines.items()],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_analytics_come_from_the_rollups(self):
+        self.assertEqual(DailySales.objects.count(), 1)
+        response = self.client.get('/api/auth/analytics/sales/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {
+            'invoices': 2, 'subtotal': '110.04', 'gst_amount': '9.84', 'total': '119.88',
+        })
+        [bucket] = response.data['buckets']
+        self.assertEqual(bucket['start'], timezone.localdate().isoformat())
+        self.assertEqual(
+            [(row['name'], row['quantity'], row['subtotal'], row['gst_amount']) for row in response.data['top_products']],
+            [('Milk', 3, '99.99', '9.33'), ('Bread', 1, '10.05', '0.50')],
+        )
+
+        # A rebuild from the invoices lands on the same numbers.
+        rollups.rebuild(self.store.pk)
+        self.assertEqual(self.client.get('/api/auth/analytics/sales/').data, response.data)
+
+    def test_gst_report(self):
+        response = self.client.get('/api/auth/reports/gst/?output=json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([dict(row) for row in response.data], [
+            {'rate': '5.00', 'invoices': 1, 'taxable_value': '76.71', 'gst_amount': '3.84', 'total': '80.55'},
+            {'rate': '18.00', 'invoices': 1, 'taxable_value': '33.33', 'gst_amount': '6.00', 'total': '39.33'},
+        ])
+
+        response = self.client.get('/api/auth/reports/gst/?group=product')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), [
+            'product,product_name,rate,quantity,taxable_value,gst_amount',
+            f'{self.milk.pk},Milk,5.00,2,66.66,3.33',
+            f'{self.milk.pk},Milk,18.00,1,33.33,6.00',
+            f'{self.bread.pk},Bread,5.00,1,10.05,0.50',
+        ])
+
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        response = self.client.get(f'/api/auth/reports/gst/?output=json&group=customer&from={tomorrow}')
+        self.assertEqual(response.data, [])
+        self.assertEqual(self.client.get('/api/auth/reports/gst/?group=store').status_code, 400)
+
+
+class StockAlertStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        milk = Product.objects.create(store=self.store, name='Milk', price='30.00', stock=1, reorder_level=2)
+        self.alerts = [
+            StockAlert.objects.create(store=self.store, product=milk, stock=1, reorder_level=2).pk
+            for _ in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def event_ids(self, body):
+        return [int(line[4:]) for line in body.splitlines() if line.startswith('id: ')]
+
+    @override_settings(STOCK_ALERT_STREAM_SECONDS=0)
+    def test_stream_resumes_after_the_last_event(self):
+        response = self.client.get('/api/auth/alerts/stock/stream/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn('event: low_stock', body)
+        self.assertEqual(self.event_ids(body), self.alerts)
+
+        response = self.client.get('/api/auth/alerts/stock/stream/', HTTP_LAST_EVENT_ID=str(self.alerts[0]))
+        self.assertEqual(self.event_ids(b''.join(response.streaming_content).decode()), self.alerts[1:])
+        response = self.client.get(f'/api/auth/alerts/stock/stream/?since={self.alerts[1]}')
+        self.assertEqual(self.event_ids(b''.join(response.streaming_content).decode()), self.alerts[2:])
+
+    @override_settings(STOCK_ALERT_MAX_STREAMS=0, STOCK_ALERT_POLL_SECONDS=60)
+    def test_streams_past_the_cap_do_not_wait(self):
+        response = self.client.get('/api/auth/alerts/stock/stream/')
+        started = time.monotonic()
+        body = b''.join(response.streaming_content).decode()
+        self.assertLess(time.monotonic() - started, 30)
+        self.assertEqual(self.event_ids(body), self.alerts)
+        self.assertNotIn('keep-alive', body)
+
+    @override_settings(STOCK_ALERT_STREAM_SECONDS=0)
+    def test_async_stream(self):
+        from .async_views import StockAlertStreamView
+
+        async def read(response):
+            return ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+        request = APIRequestFactory().get('/', HTTP_LAST_EVENT_ID=str(self.alerts[0]))
+        force_authenticate(request, user=self.user)
+        response = async_to_sync(StockAlertStreamView.as_view())(request)
+        self.assertEqual(self.event_ids(async_to_sync(read)(response)), self.alerts[1:])
+
+
+class AsyncViewTests(TestCase):
+    """The ASGI read endpoints authenticate and page like their sync versions."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        customer = Customer.objects.create(store=self.store, name='Walk-in')
+        for _ in range(3):
+            Invoice.objects.create(store=self.store, customer=customer)
+        self.token = StoreRefreshToken.for_user(self.user).access_token
+
+    def get(self, name, path='/', token=True, **headers):
+        from . import async_views
+
+        if token:
+            headers.setdefault('HTTP_AUTHORIZATION', f'Bearer {self.token}')
+        request = APIRequestFactory().get(path, **headers)
+        return async_to_sync(getattr(async_views, name).as_view())(request)
+
+    def test_token_is_checked(self):
+        self.assertEqual(self.get('ProductListView', token=False).status_code, 401)
+        self.assertEqual(self.get('ProductListView', HTTP_AUTHORIZATION='Bearer nonsense').status_code, 401)
+
+    def test_reads(self):
+        response = self.get('ProductListView')
+        self.assertEqual([row['name'] for row in response.data], ['Milk'])
+        self.assertEqual(self.get('ProductListView', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        first = self.get('InvoiceListView', '/?page_size=2')
+        self.assertEqual(len(first.data['results']), 2)
+        rest = self.get('InvoiceListView', first.data['next'])
+        self.assertIsNone(rest.data['next'])
+        ids = [row['id'] for row in first.data['results'] + rest.data['results']]
+        self.assertEqual(ids, list(Invoice.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+        self.assertEqual(self.get('StoreDetailView').data['name'], 'Corner Shop')
+        self.assertEqual(self.get('CustomerListView', '/?search=walk').data[0]['name'], 'Walk-in')
+
+
+class CustomerSearchTests(TestCase):
+    """?search= on the customer list: prefix matches first, then substrings."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name, phone, email in (
+            ('Ali Khan', '98765 43210', ''),
+            ('Julie Park', '', 'julie@example.com'),
+            ('Lina Roy', '', ''),
+            ('Parker Lane', '', 'lane@parker.in'),
+        ):
+            Customer.objects.create(store=self.store, name=name, phone=phone, email=email)
+        other = Store.objects.create(user=User.objects.create_user(username='other', password='pass'), name='Other')
+        Customer.objects.create(store=other, name='Lisa Park')
+
+    def search(self, query):
+        response = self.client.get('/api/auth/customers/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data]
+
+    def test_prefix_matches_rank_before_substrings(self):
+        self.assertEqual(self.search('PARK'), ['Parker Lane', 'Julie Park'])
+        self.assertEqual(self.search('  ali  '), ['Ali Khan'])
+
+    def test_phone_and_email_match(self):
+        self.assertEqual(self.search('43210'), ['Ali Khan'])
+        self.assertEqual(self.search('julie@example'), ['Julie Park'])
+        self.assertEqual(self.search('nobody'), [])
+
+    def test_short_queries_match_substrings(self):
+        # Too short for the trigram index, but "li" still finds Ali and Julie.
+        self.assertEqual(self.search('li'), ['Lina Roy', 'Ali Khan', 'Julie Park'])
+        self.assertEqual(self.search('k'), ['Ali Khan', 'Julie Park', 'Parker Lane'])
+
+    def test_limit_defaults_and_is_clamped(self):
+        Customer.objects.bulk_create([Customer(store=self.store, name=f'Bulk {i:03}') for i in range(120)])
+        self.assertEqual(len(self.search('bulk')), 20)
+        for limit, expected in (('5', 5), ('0', 1), ('500', 100)):
+            response = self.client.get('/api/auth/customers/', {'search': 'bulk', 'limit': limit})
+            self.assertEqual([row['name'] for row in response.data], [f'Bulk {i:03}' for i in range(expected)])
+        self.assertEqual(self.client.get('/api/auth/customers/', {'search': 'bulk', 'limit': 'x'}).status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """Every query the read endpoints run is answered from an index.
+
+    Each endpoint is requested against a seeded multi-store dataset and every
+    query it ran is EXPLAINed; a sequential scan of any table fails the test
+    with the query and its plan. On Postgres seq scans are disabled while
+    explaining, so a Seq Scan node means no index could serve the query at
+    all, however small the tables.
+    """
+    # Invoices per store; requests are made as the last, smaller store, so
+    # each request reads a small share of every table as it would in
+    # production.
+    store_sizes = (3000, 3000, 600)
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        for index, size in enumerate(cls.store_sizes):
+            user = User.objects.create_user(username=f'owner{index}', password='pass')
+            store = Store.objects.create(user=user, name=f'Shop {index}')
+            products = Product.objects.bulk_create(
+                Product(
+                    store=store, name=f'Product {i}', price=Decimal(10 + i), stock=i % 40, sku=f'{index}-{i}',
+                    reorder_level=10 if i % 3 == 0 else None,
+                )
+                for i in range(200)
+            )
+            customers = Customer.objects.bulk_create(
+                Customer(store=store, name=f'Customer {i}', phone=f'9{index:03d}{i:06d}') for i in range(500)
+            )
+            invoices = Invoice.objects.bulk_create(
+                Invoice(store=store, customer=customers[i % len(customers)], subtotal=30, gst_amount=5.4, total=35.4)
+                for i in range(size)
+            )
+            for i, invoice in enumerate(invoices):
+                invoice.created_at = now - datetime.timedelta(hours=i * 3)
+            Invoice.objects.bulk_update(invoices, ['created_at'], batch_size=500)
+            InvoiceItem.objects.bulk_create(
+                InvoiceItem(invoice=invoice, product=products[(i + line) % len(products)], quantity=1, price=10)
+                for i, invoice in enumerate(invoices)
+                for line in range(3)
+            )
+            StockAlert.objects.bulk_create(
+                StockAlert(store=store, product=product, stock=1, reorder_level=10) for product in products[:50]
+            )
+            rollups.rebuild(store.pk)
+        cls.user, cls.store, cls.invoice = user, store, invoices[100]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'No plan checks for {connection.vendor}.')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sequential_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                nodes = [plan[0]['Plan']]
+                scans = []
+                while nodes:
+                    node = nodes.pop()
+                    if node['Node Type'] == 'Seq Scan':
+                        scans.append(f"Seq Scan on {node['Relation Name']}")
+                    nodes.extend(node.get('Plans', []))
+                return scans, plan
+
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[3] for row in cursor.fetchall()]
+        # Subqueries SQLite materializes are scanned by name; that's fine.
+        derived = {step.split()[-1] for step in plan if step.startswith(('MATERIALIZE', 'CO-ROUTINE'))}
+        scans = [
+            step for step in plan
+            if step.startswith('SCAN ') and ' USING ' not in step and 'VIRTUAL TABLE' not in step
+            and step.split()[1] not in derived and step != 'SCAN CONSTANT ROW'
+        ]
+        return scans, plan
+
+    def assertIndexed(self, url, follow_next=False):
+        with CaptureQueriesContext(connection) as queries, mock.patch('accounts.pdf.schedule'):
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            if follow_next:
+                # The second page: a keyset seek rather than the top of the index.
+                queries.initial_queries = len(connection.queries_log)
+                response = self.client.get(response.data['next'])
+        self.assertIn(response.status_code, (200, 202), url)
+
+        failures = []
+        for query in queries.captured_queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            scans, plan = self.sequential_scans(query['sql'])
+            if scans:
+                failures.append(f"{query['sql'][:500]}\n  {'; '.join(scans)}\n  {plan}")
+        if failures:
+            self.fail(f'{url} scans a table sequentially:\n' + '\n'.join(failures))
+
+    def test_invoice_reads_use_indexes(self):
+        today = timezone.localdate()
+        month = f'from={today - datetime.timedelta(days=30)}&to={today}'
+        self.assertIndexed('/api/auth/invoices/')
+        self.assertIndexed('/api/auth/invoices/?page_size=20')
+        self.assertIndexed('/api/auth/invoices/?page_size=20', follow_next=True)
+        self.assertIndexed('/api/auth/invoices/?page_size=20&fields=id,total', follow_next=True)
+        self.assertIndexed(f'/api/auth/invoices/{self.invoice.pk}/')
+        self.assertIndexed(f'/api/auth/invoices/{self.invoice.pk}/pdf/')
+        self.assertIndexed(f'/api/auth/invoices/export/?{month}')
+
+    def test_customer_and_catalog_reads_use_indexes(self):
+        self.assertIndexed('/api/auth/customers/?page_size=50', follow_next=True)
+        self.assertIndexed('/api/auth/customers/?search=customer 1')
+        self.assertIndexed('/api/auth/customers/?search=stomer 12')
+        self.assertIndexed('/api/auth/customers/?search=r1')
+        self.assertIndexed('/api/auth/products/')
+        self.assertIndexed('/api/auth/products/?low_stock=1')
+        self.assertIndexed('/api/auth/products/scan/2-5/')
+        self.assertIndexed('/api/auth/sync/?since=100')
+        self.assertIndexed('/api/auth/alerts/stock/?since=10')
+
+    def test_reports_use_indexes(self):
+        today = timezone.localdate()
+        quarter = f'from={today - datetime.timedelta(days=90)}&to={today}'
+        self.assertIndexed(f'/api/auth/analytics/sales/?{quarter}')
+        self.assertIndexed(f'/api/auth/analytics/sales/?{quarter}&period=month')
+        for group in ('rate', 'day', 'customer', 'product'):
+            self.assertIndexed(f'/api/auth/reports/gst/?{quarter}&group={group}')
+
+
+class InstrumentationTests(TestCase):
+    """Requests report where their time went, per request and in /metrics."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass')
+        self.store = Store.objects.create(user=self.user, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_metrics(self):
+        Product.objects.create(store=self.store, name='Milk', price='30.00', stock=5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/auth/products/')
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('billing_request_seconds_count{endpoint="product-list",method="GET"}', metrics)
+        self.assertIn('billing_requests_total{endpoint="product-list",method="GET",status="200"}', metrics)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 404)
+
+    def test_exited_workers_are_folded_into_one_file(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        for name in ('101-a', '102-b', '101-c'):
+            worker = Registry()
+            worker.process = (os.getpid(), name)
+            worker.requests.inc('endpoint="product-list"')
+            worker.flush(directory)
+        totals = merge(read_snapshots(directory))
+        self.assertEqual(totals['billing_requests_total'], {'endpoint="product-list"': 3})
+
+        fold_exited(directory, 101)
+        self.assertEqual(sorted(path.name for path in directory.iterdir()), ['102-b.json', 'exited.json'])
+        self.assertEqual(merge(read_snapshots(directory)), totals)
+
+        # A scrape that still sees a file just folded doesn't count it twice.
+        leftover = (directory / '102-b.json').read_text()
+        fold_exited(directory, 102)
+        (directory / '102-b.json').write_text(leftover)
+        self.assertEqual(merge(read_snapshots(directory)), totals)
+
+    def test_repeated_statement_is_flagged(self):
+        customers = [Customer.objects.create(store=self.store, name=f'Customer {i}') for i in range(12)]
+
+        def view(request):
+            for customer in customers:
+                Customer.objects.get(pk=customer.pk)
+            return HttpResponse()
+
+        with self.assertLogs('accounts.instrumentation', 'WARNING'):
+            response = InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('N+1 x12', response['Server-Timing'])
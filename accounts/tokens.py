@@ -0,0 +1,21 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Store
+
+
+class StoreRefreshToken(RefreshToken):
+    """Refresh token that also carries the claims the stateless auth mode needs.
+
+    Access tokens minted from it copy these claims, so a request can be
+    authorised from the token alone. ``ver`` ties the token to
+    ``User.token_version``.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['store_id'] = Store.objects.filter(user_id=user.pk).values_list('pk', flat=True).first()
+        token['is_active_subscriber'] = user.is_active_subscriber
+        token['subscription_end'] = user.subscription_end.isoformat() if user.subscription_end else None
+        token['ver'] = user.token_version
+        return token
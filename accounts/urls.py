@@ -1,43 +1,54 @@
+from django.conf import settings
 from django.urls import path
-from .views import (
-    RegisterView,
-    LoginView,
-    StoreCreateView,
-    ProductCreateView,
-    ProductListView,
-    CustomerCreateView,
-    CustomerListView,
-    CustomerDeleteView,
-    CustomerUpdateView,
-    CreateInvoiceView,
-    InvoiceListView, StoreDetailView, InvoiceRetrieveView
-)
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from .views import lazy_view
+
+# Async versions of the read endpoints; see accounts.async_views.
+ASYNC_VIEWS = {
+    'CustomerListView', 'InvoiceListView', 'InvoicePDFView', 'ProductListView', 'StockAlertStreamView',
+    'StoreDetailView',
+}
+
+
+def view(name):
+    # Views are imported on their first request; see accounts.views.
+    if settings.SERVING_MODE == 'asgi' and name in ASYNC_VIEWS:
+        return lazy_view(name, 'accounts.async_views')
+    return lazy_view(name)
+
 
 urlpatterns = [
-    path('register/', RegisterView.as_view(), name='register'),
-    path('login/', LoginView.as_view(), name='login'),
+    path('register/', view('RegisterView'), name='register'),
+    path('login/', view('LoginView'), name='login'),
+
+    path('token/', lazy_view('TokenObtainPairView', 'rest_framework_simplejwt.views'), name='token_obtain_pair'),
+    path('token/refresh/', lazy_view('TokenRefreshView', 'rest_framework_simplejwt.views'), name='token_refresh'),
+
+    path('store/create/', view('StoreCreateView'), name='create_store'),
+    path('store/', view('StoreDetailView'), name='store-detail'),
 
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-    path('store/create/', StoreCreateView.as_view(), name='create_store'),
-    path('store/', StoreDetailView.as_view(), name='store-detail'),
+    path('product/create/', view('ProductCreateView'), name='add_product'),
+    path('products/', view('ProductListView'), name='product-list'),
+    path('products/scan/<str:sku>/', view('ProductScanView'), name='product-scan'),
 
+    path('customers/create/', view('CustomerCreateView'), name='add_customer'),
+    path('customers/', view('CustomerListView'), name='customer-list'),
+path('customers/<int:pk>/delete/', view('CustomerDeleteView'), name='customer-delete'),
+path('customers/<int:pk>/update/', view('CustomerUpdateView'), name='customer-update'),
 
-    path('product/create/', ProductCreateView.as_view(), name='add_product'),
-    path('products/', ProductListView.as_view(), name='product-list'),
+    path('sync/', view('SyncView'), name='sync'),
 
-    path('customers/create/', CustomerCreateView.as_view(), name='add_customer'),
-    path('customers/', CustomerListView.as_view(), name='customer-list'),
-path('customers/<int:pk>/delete/', CustomerDeleteView.as_view(), name='customer-delete'),
-path('customers/<int:pk>/update/', CustomerUpdateView.as_view(), name='customer-update'),
 
+    path('invoice/create/', view('CreateInvoiceView'), name='invoice-create'),
+    path('invoices/bulk/', view('InvoiceBulkCreateView'), name='invoice-bulk-create'),
+    path('invoices/', view('InvoiceListView'), name='invoice-list'),
+    path('invoices/export/', view('InvoiceExportView'), name='invoice-export'),
+    path('invoices/pdf/batch/', view('InvoicePDFBatchView'), name='invoice-pdf-batch'),
+path('invoices/<int:pk>/', view('InvoiceRetrieveView'), name='invoice-detail'),
+    path('invoices/<int:pk>/pdf/', view('InvoicePDFView'), name='invoice-pdf'),
 
-    path('invoice/create/', CreateInvoiceView.as_view(), name='invoice-create'),
-    path('invoices/', InvoiceListView.as_view(), name='invoice-list'),
-path('invoices/<int:pk>/', InvoiceRetrieveView.as_view(), name='invoice-detail'),
+    path('analytics/sales/', view('SalesAnalyticsView'), name='sales-analytics'),
+    path('reports/gst/', view('GSTReportView'), name='gst-report'),
+    path('alerts/stock/', view('StockAlertFeedView'), name='stock-alerts'),
+    path('alerts/stock/stream/', view('StockAlertStreamView'), name='stock-alert-stream'),
 ]
@@ -0,0 +1,146 @@
+"""Low-stock alerts, as a cursor feed and as server-sent events."""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from ..models import StockAlert
+from ..serializers import StockAlertSerializer
+from .common import streaming_response
+
+
+def stock_alerts_after(store, since):
+    # Checkout writes alerts while holding the store row, so a store's alert
+    # ids commit in increasing order and an id cursor never skips one.
+    return StockAlert.objects.filter(store=store, id__gt=since).select_related('product').order_by('id')
+
+
+def release_connection():
+    # A stream spends nearly all its time waiting; don't sit on a database
+    # connection (or a pool slot) meanwhile. The next poll opens one again.
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+class StreamSlots:
+    """Counts the streams this process is holding open."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.open >= settings.STOCK_ALERT_MAX_STREAMS:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.open -= 1
+
+
+stream_slots = StreamSlots()
+
+
+class StockAlertFeedView(APIView):
+    """Low-stock alerts raised after ``?since=<cursor>``, oldest first.
+
+    Keep the ``cursor`` from the last response and send it back next time;
+    ``stream/`` serves the same feed as server-sent events.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 100
+    max_limit = 1000
+
+    def get(self, request):
+        try:
+            since = int(request.GET.get('since', 0))
+            limit = max(1, min(int(request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return Response({'error': "'since' and 'limit' must be integers."}, status=400)
+
+        alerts = list(stock_alerts_after(request.user.store, since)[:limit + 1])
+        page = alerts[:limit]
+        return Response({
+            'cursor': page[-1].pk if page else since,
+            'has_more': len(alerts) > limit,
+            'alerts': StockAlertSerializer(page, many=True).data,
+        })
+
+
+class EventStreamRenderer(BaseRenderer):
+    # Lets DRF accept an EventSource's "Accept: text/event-stream"; only
+    # error responses are rendered through it, as JSON.
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class StockAlertStreamView(APIView):
+    """The low-stock alert feed as server-sent events.
+
+    Each alert is a ``low_stock`` event whose id is its feed cursor. The
+    stream polls for new alerts (an index range read, never the catalog)
+    and ends after ``STOCK_ALERT_STREAM_SECONDS`` so it doesn't hold a
+    worker forever; the client reconnects with ``Last-Event-ID`` and picks
+    up where it left off. Only ``STOCK_ALERT_MAX_STREAMS`` streams per
+    process wait for new alerts; any others send what's new and end, and
+    the client reconnects after the ``retry`` interval, so open dashboards
+    never take every thread from checkout. accounts.async_views serves the
+    stream from the event loop under ASGI.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+    batch_size = 100
+    streaming_response = staticmethod(streaming_response)
+
+    def get(self, request):
+        try:
+            since = int(request.headers.get('Last-Event-ID') or request.GET.get('since', 0))
+        except ValueError:
+            return Response({'error': "'since' must be an integer."}, status=400)
+
+        response = self.streaming_response(self.events(request.user.store, since), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def events(self, store, since):
+        poll = settings.STOCK_ALERT_POLL_SECONDS
+        deadline = time.monotonic() + settings.STOCK_ALERT_STREAM_SECONDS
+        encoder = JSONEncoder()
+        yield f'retry: {int(poll * 1000)}\n\n'
+        # Taken once the stream is being read, so one that never is can't leak it.
+        waiting = stream_slots.acquire()
+        try:
+            while True:
+                alerts = list(stock_alerts_after(store, since)[:self.batch_size])
+                for alert in alerts:
+                    yield alert_event(encoder, alert)
+                    since = alert.pk
+                if len(alerts) == self.batch_size:
+                    continue
+                if not waiting or time.monotonic() >= deadline:
+                    return
+                # A comment line, so a dropped client is noticed on the next write.
+                yield ': keep-alive\n\n'
+                release_connection()
+                time.sleep(poll)
+        finally:
+            if waiting:
+                stream_slots.release()
+
+
+def alert_event(encoder, alert):
+    data = encoder.encode(StockAlertSerializer(alert).data)
+    return f'id: {alert.pk}\nevent: low_stock\ndata: {data}\n\n'
@@ -0,0 +1,71 @@
+"""Registration and login."""
+from django.contrib.auth import authenticate
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..models import User
+from ..tokens import StoreRefreshToken
+
+
+# 🔐 Helper for generating JWT tokens
+def get_tokens_for_user(user):
+    refresh = StoreRefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
+
+# ✅ Register View
+class RegisterView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        data = request.data
+        try:
+            password = data.get('password')
+            password2 = data.get('password2')
+
+            if password != password2:
+                return Response({'error': "Passwords do not match."}, status=status.HTTP_400_BAD_REQUEST)
+
+            validate_password(password)
+
+            user = User.objects.create_user(
+                username=data.get('username'),
+                email=data.get('email'),
+                password=password
+            )
+            return Response({"message": "User registered successfully."}, status=status.HTTP_201_CREATED)
+
+        except ValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+# ✅ Login View
+class LoginView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        data = request.data
+        username = data.get('username')
+        password = data.get('password')
+
+        user = authenticate(username=username, password=password)
+
+        if user:
+            tokens = get_tokens_for_user(user)
+            return Response({
+                "message": "Login successful.",
+                "tokens": tokens,
+                "user": {
+                    "username": user.username,
+                    "email": user.email
+                }
+            })
+        else:
+            return Response({"error": "Invalid credentials."}, status=status.HTTP_401_UNAUTHORIZED)
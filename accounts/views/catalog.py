@@ -0,0 +1,124 @@
+"""Products, barcode scans and the delta sync feed."""
+import itertools
+
+from django.db.models import F
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..catalog import catalog_cache, catalog_etag, catalog_version, sku_cache
+from ..models import Customer, Product, Tombstone
+from ..pagination import IdCursorPagination
+from ..serializers import CustomerSerializer, ProductSerializer
+
+
+#to view products
+class ProductListView(ListAPIView):
+    # Terminals poll this; see accounts.catalog for the versioning scheme.
+    serializer_class = ProductSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        products = Product.objects.filter(store=self.request.user.store).order_by('id')
+        # ?low_stock=1: products at or below their reorder level, off the partial index.
+        if self.request.GET.get('low_stock') in ('1', 'true'):
+            products = products.filter(stock__lte=F('reorder_level'))
+        return products
+
+    def list(self, request, *args, **kwargs):
+        store_id = request.user.store.pk
+        query = request.GET.urlencode()
+        version = catalog_version(store_id)
+        etag = catalog_etag(store_id, version, query)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = catalog_cache.get((store_id, query), version)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            # Plain containers, so the cache doesn't pin the serializer and its queryset.
+            if isinstance(data, dict):
+                data = {**data, 'results': list(data['results'])}
+            else:
+                data = list(data)
+            catalog_cache.put((store_id, query), version, data)
+        return Response(data, headers={'ETag': etag})
+class ProductScanView(APIView):
+    """Product for a scanned barcode / SKU.
+
+    Also warms the SKU cache that invoice creation resolves ``sku`` lines
+    through, so a basket that was just scanned bills without a product lookup.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, sku):
+        store_id = request.user.store.pk
+        product = Product.objects.filter(store_id=store_id, sku=sku).first()
+        if product is None:
+            return Response({'error': 'Product not found'}, status=404)
+        sku_cache.put(store_id, sku, product.pk)
+        return Response(ProductSerializer(product).data)
+
+
+# ✅ Create Product View
+class ProductCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        data = request.data.copy()
+        data['store'] = user.store.id
+        serializer = ProductSerializer(data=data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data,status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class SyncView(APIView):
+    """Products, customers and deletions changed since ``?since=<cursor>``.
+
+    Every product/customer write and every delete takes the store's next
+    change sequence number, so a till keeps the ``cursor`` from the last
+    response and sends it back next time. Leaving ``since`` out starts from
+    the beginning, which pages through the whole catalog ``limit`` changes
+    at a time. Changes that share a sequence number (the stock lines of one
+    invoice) always come back together.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 500
+    max_limit = 5000
+
+    def get(self, request):
+        try:
+            since = int(request.GET.get('since', 0))
+            limit = max(1, min(int(request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return Response({'error': "'since' and 'limit' must be integers."}, status=400)
+
+        store = request.user.store
+        products = Product.objects.filter(store=store)
+        customers = Customer.objects.filter(store=store)
+        tombstones = Tombstone.objects.filter(store=store)
+
+        seqs = sorted(itertools.chain.from_iterable(
+            rows.filter(change_seq__gt=since).order_by('change_seq').values_list('change_seq', flat=True)[:limit + 1]
+            for rows in (products, customers, tombstones)
+        ))
+        cursor = seqs[min(limit, len(seqs)) - 1] if seqs else since
+        window = {'change_seq__gt': since, 'change_seq__lte': cursor}
+
+        deleted = {'products': [], 'customers': []}
+        for model, object_id in tombstones.filter(**window).values_list('model', 'object_id'):
+            deleted[f'{model}s'].append(object_id)
+
+        return Response({
+            'cursor': cursor,
+            'has_more': len(seqs) > limit,
+            'products': ProductSerializer(products.filter(**window), many=True).data,
+            'customers': CustomerSerializer(customers.filter(**window), many=True).data,
+            'deleted': deleted,
+        })
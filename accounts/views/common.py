@@ -0,0 +1,39 @@
+"""Helpers shared by the view modules."""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+
+def parse_date_range(request):
+    """Read optional ``from``/``to`` YYYY-MM-DD query params; ValueError if malformed."""
+    days = []
+    for param in ('from', 'to'):
+        value = request.GET.get(param)
+        day = parse_date(value) if value else None
+        if value and day is None:
+            raise ValueError(f"'{param}' must be a YYYY-MM-DD date.")
+        days.append(day)
+    return days
+
+
+def streaming_response(stream, **kwargs):
+    """StreamingHttpResponse over ``stream`` that streams under ASGI as well."""
+    if settings.SERVING_MODE == 'asgi':
+        stream = iterate_in_thread(stream)
+    return StreamingHttpResponse(stream, **kwargs)
+
+
+async def iterate_in_thread(iterator):
+    # Served over ASGI, Django reads a sync iterator to the end before it
+    # sends the first byte. Pull it one chunk at a time instead, on the
+    # request's own thread, where its database cursor lives.
+    iterator = iter(iterator)
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
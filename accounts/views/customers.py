@@ -0,0 +1,82 @@
+"""Customers: create, list and search, update, delete."""
+from rest_framework import status
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..models import Customer
+from ..pagination import IdCursorPagination
+from ..search import search_customers
+from ..serializers import CustomerSerializer
+
+
+# ✅ Create Customer View
+class CustomerCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        store = getattr(user, 'store', None)
+
+        if not store:
+            return Response({"detail": "User does not have a store."}, status=400)
+
+        data = request.data.copy()
+        serializer = CustomerSerializer(data=data)
+
+        if serializer.is_valid():
+            serializer.save(store=store)  # ✅ explicitly assign store
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+#TO VIEW CUSTOMERS
+class CustomerListView(ListAPIView):
+    serializer_class = CustomerSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    search_limit = 20
+    max_search_limit = 100
+
+    def get_queryset(self):
+        return Customer.objects.filter(store=self.request.user.store).order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        # ?search= matches name, phone or email and returns the best matches only.
+        query = request.GET.get('search', '')
+        if not query.strip():
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = max(1, min(int(request.GET.get('limit', self.search_limit)), self.max_search_limit))
+        except ValueError:
+            return Response({'error': "'limit' must be an integer."}, status=400)
+        customers = search_customers(request.user.store, query, limit)
+        return Response(self.get_serializer(customers, many=True).data)
+
+class CustomerUpdateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, pk):
+        try:
+            customer = Customer.objects.get(pk=pk, store=request.user.store)
+        except Customer.DoesNotExist:
+            return Response({'error': 'Customer not found'}, status=404)
+
+        serializer = CustomerSerializer(customer, data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        return Response(serializer.errors, status=400)
+
+
+class CustomerDeleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, pk):
+        try:
+            customer = Customer.objects.get(pk=pk, store=request.user.store)
+            customer.delete()
+            return Response({"message": "Customer deleted."})
+        except Customer.DoesNotExist:
+            return Response({"error": "Customer not found."}, status=404)
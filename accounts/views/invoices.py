@@ -0,0 +1,180 @@
+"""Invoice creation, bulk upload, listing and export."""
+import logging
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError as RequestValidationError
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from .. import checkout
+from ..models import Invoice
+from ..pagination import InvoiceCursorPagination
+from ..serializers import (
+    DynamicFieldsMixin,
+    InvoiceCreateSerializer,
+    InvoiceDetailSerializer,
+    InvoiceIngestResultSerializer,
+    InvoiceIngestSerializer,
+    InvoiceListSerializer,
+    InvoiceReadSerializer,
+)
+from .common import parse_date_range, streaming_response
+
+logger = logging.getLogger(__name__)
+
+
+# ✅ Create Invoice View
+
+class CreateInvoiceView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        data = request.data.copy()
+        data['store'] = request.user.store.id  # optional if serializer gets it from context
+        serializer = InvoiceCreateSerializer(data=data, context={'request': request})  # ✅ FIXED HERE
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=201)
+        logger.info('Invoice creation rejected: %s', serializer.errors)
+        return Response(serializer.errors, status=400)
+
+class InvoiceBulkCreateView(APIView):
+    """Upload of invoices a till billed while offline.
+
+    Takes ``{"invoices": [...]}`` (or a bare list), each shaped like an
+    ``invoice/create/`` payload plus an ``idempotency_key``. Everything is
+    validated up front with one product and one customer query for the whole
+    upload, then written ``INVOICE_BULK_GROUP_SIZE`` invoices per transaction.
+    ``results`` lines up with the request: ``created``, ``replayed`` (the key
+    was seen before; the original invoice is returned) or ``rejected``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        payloads = request.data.get('invoices') if isinstance(request.data, dict) else request.data
+        if not isinstance(payloads, list) or not payloads:
+            return Response({'invoices': 'Expected a non-empty list of invoices.'}, status=400)
+        limit = settings.INVOICE_BULK_LIMIT
+        if len(payloads) > limit:
+            return Response({'invoices': f'At most {limit} invoices per upload.'}, status=400)
+
+        store = request.user.store
+        context = {'request': request}
+        InvoiceIngestSerializer.preload(context, payloads)
+
+        results = [None] * len(payloads)
+        orders = []
+        for index, data in enumerate(payloads):
+            serializer = InvoiceIngestSerializer(data=data, context=context)
+            if serializer.is_valid():
+                orders.append((index, serializer.validated_data))
+            else:
+                key = data.get('idempotency_key') if isinstance(data, dict) else None
+                results[index] = {'idempotency_key': key, 'status': checkout.REJECTED, 'errors': serializer.errors}
+
+        group_size = settings.INVOICE_BULK_GROUP_SIZE
+        for start in range(0, len(orders), group_size):
+            group = orders[start:start + group_size]
+            try:
+                placed = checkout.with_retries(checkout.place_invoices, store, [order for _, order in group])
+            except RequestValidationError as e:
+                placed = [(checkout.REJECTED, e.detail)] * len(group)
+            for (index, order), (outcome, result) in zip(group, placed):
+                line = {'idempotency_key': order['idempotency_key'], 'status': outcome}
+                if outcome == checkout.REJECTED:
+                    line['errors'] = result
+                else:
+                    line['invoice'] = InvoiceIngestResultSerializer(result).data
+                results[index] = line
+
+        return Response({'results': results})
+
+
+class EagerLoadingViewMixin:
+    # Applies the serializer's select/prefetch plan on top of get_queryset,
+    # trimmed to the ?fields= the client asked for.
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        fields = None
+        if issubclass(serializer_class, DynamicFieldsMixin):
+            fields = serializer_class.requested_fields(self.request)
+        return serializer_class.setup_eager_loading(queryset, fields)
+
+
+class InvoiceListView(EagerLoadingViewMixin, ListAPIView):
+    serializer_class = InvoiceListSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = InvoiceCursorPagination
+
+    def get_queryset(self):
+        return Invoice.objects.filter(store=self.request.user.store)
+
+
+class InvoiceExportView(APIView):
+    """Streams a store's invoices, with items, as NDJSON or a JSON array.
+
+    Rows come off a server-side cursor ``chunk_size`` at a time and go out as
+    soon as each chunk is serialized, so memory stays flat whatever the date
+    range and the first bytes leave before the query has finished.
+    """
+    permission_classes = [IsAuthenticated]
+    chunk_size = 500
+
+    def get(self, request):
+        try:
+            start, end = parse_date_range(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        invoices = Invoice.objects.filter(store=request.user.store).created_between(start, end).order_by('created_at', 'id')
+
+        output = request.GET.get('output', 'ndjson')
+        if output not in ('ndjson', 'json'):
+            return Response({'error': "'output' must be 'ndjson' or 'json'."}, status=400)
+
+        rows = InvoiceReadSerializer.setup_eager_loading(invoices).iterator(chunk_size=self.chunk_size)
+        if output == 'ndjson':
+            content_type = 'application/x-ndjson'
+            stream = self.stream_ndjson(rows)
+        else:
+            content_type = 'application/json'
+            stream = self.stream_json(rows)
+
+        response = streaming_response(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="invoices.{output}"'
+        return response
+
+    def stream_chunks(self, rows):
+        serializer = InvoiceReadSerializer()
+        encoder = JSONEncoder()
+        chunk = []
+        for invoice in rows:
+            chunk.append(encoder.encode(serializer.to_representation(invoice)))
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def stream_ndjson(self, rows):
+        for chunk in self.stream_chunks(rows):
+            yield '\n'.join(chunk) + '\n'
+
+    def stream_json(self, rows):
+        yield '['
+        separator = ''
+        for chunk in self.stream_chunks(rows):
+            yield separator + ','.join(chunk)
+            separator = ','
+        yield ']'
+
+
+class InvoiceRetrieveView(EagerLoadingViewMixin, RetrieveAPIView):
+    serializer_class = InvoiceDetailSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Invoice.objects.filter(store=self.request.user.store)
@@ -0,0 +1,73 @@
+"""Invoice PDFs, one at a time or zipped in batches; see accounts.pdf."""
+from django.conf import settings
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .. import pdf
+from ..instrumentation import span
+from ..models import Invoice
+from ..serializers import InvoiceDetailSerializer
+from .common import parse_date_range, streaming_response
+
+
+class InvoicePDFView(APIView):
+    # Serves the cached PDF, or queues a render and answers 202 so the
+    # web worker never waits on WeasyPrint; the client retries shortly.
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        invoices = InvoiceDetailSerializer.setup_eager_loading(Invoice.objects.filter(store=request.user.store))
+        invoice = get_object_or_404(invoices, pk=pk)
+        with span('pdf'):
+            html_string = render_to_string('invoice_template.html', {'invoice': invoice})
+            key = pdf.cache_key(html_string)
+
+            path = pdf.lookup(key)
+            if path is None:
+                pdf.schedule(key, html_string)
+        if path is None:
+            return Response({'status': 'rendering'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '1'})
+
+        response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+        response['Content-Disposition'] = f'filename="invoice_{pk}.pdf"'
+        response['ETag'] = f'"{key}"'
+        return response
+
+
+class InvoicePDFBatchView(APIView):
+    """Zip of invoice PDFs for ``?ids=1,2,3`` or a ``from``/``to`` date range.
+
+    PDFs are rendered in parallel on the render pool and each one is written
+    into the zip as soon as it finishes.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        invoices = Invoice.objects.filter(store=request.user.store)
+        ids = request.GET.get('ids')
+        if ids:
+            try:
+                pks = [int(pk) for pk in ids.split(',')]
+            except ValueError:
+                return Response({'error': "'ids' must be a comma-separated list of ids."}, status=400)
+            invoices = invoices.filter(pk__in=pks)
+        else:
+            try:
+                invoices = invoices.created_between(*parse_date_range(request))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
+
+        limit = settings.INVOICE_PDF_BATCH_LIMIT
+        if invoices.count() > limit:
+            return Response({'error': f'At most {limit} invoices per batch.'}, status=400)
+
+        executor = pdf.get_executor()
+        entries = pdf.render_batch(pdf.invoice_html(invoices), executor, window=settings.PDF_RENDER_WORKERS * 4)
+        response = streaming_response(pdf.stream_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
+        return response
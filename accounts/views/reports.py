@@ -0,0 +1,97 @@
+"""Sales analytics and GST reports."""
+import datetime
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .. import gst
+from ..models import DailyProductSales, DailySales
+from ..serializers import SalesBucketSerializer, SalesTotalsSerializer, TopProductSerializer
+from .common import parse_date_range, streaming_response
+
+
+class SalesAnalyticsView(APIView):
+    """Revenue, GST and top products for a ``from``/``to`` range, from the daily rollups.
+
+    ``period`` buckets the days by ``day`` (default), ``week`` or ``month``;
+    ``top`` is how many products to rank by revenue. Without a range, the
+    last 30 days are reported.
+    """
+    permission_classes = [IsAuthenticated]
+    periods = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+    default_days = 30
+    max_top = 100
+
+    def get(self, request):
+        try:
+            start, end = parse_date_range(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        try:
+            top = max(0, min(int(request.GET.get('top', 10)), self.max_top))
+        except ValueError:
+            return Response({'error': "'top' must be an integer."}, status=400)
+        period = request.GET.get('period', 'day')
+        if period not in self.periods:
+            return Response({'error': "'period' must be 'day', 'week' or 'month'."}, status=400)
+        end = end or timezone.localdate()
+        start = start or end - datetime.timedelta(days=self.default_days - 1)
+
+        store = request.user.store
+        days = DailySales.objects.filter(store=store, day__range=(start, end))
+        sums = {name: Sum(name) for name in ('invoices', 'subtotal', 'gst_amount', 'total')}
+        trunc = self.periods[period]
+        bucket = trunc('day') if trunc else F('day')
+        buckets = days.values(start=bucket).annotate(**sums).order_by('start')
+        totals = days.aggregate(**sums)
+
+        top_products = (
+            DailyProductSales.objects.filter(store=store, day__range=(start, end))
+            .values('product', name=F('product__name'))
+            .annotate(quantity=Sum('quantity'), subtotal=Sum('subtotal'), gst_amount=Sum('gst_amount'))
+            .order_by('-subtotal', 'product')[:top]
+        )
+        return Response({
+            'from': start,
+            'to': end,
+            'period': period,
+            'totals': SalesTotalsSerializer({name: value or 0 for name, value in totals.items()}).data,
+            'buckets': SalesBucketSerializer(buckets, many=True).data,
+            'top_products': TopProductSerializer(top_products, many=True).data,
+        })
+
+
+class GSTReportView(APIView):
+    """GST summary for a ``from``/``to`` range, grouped by ``rate`` (default),
+    ``day``, ``customer`` or ``product``.
+
+    Streams CSV unless ``output=json``. The database does the grouping; see
+    accounts.gst.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            start, end = parse_date_range(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        group_by = request.GET.get('group', 'rate')
+        if group_by not in gst.COLUMNS:
+            return Response({'error': f"'group' must be one of {', '.join(gst.COLUMNS)}."}, status=400)
+        output = request.GET.get('output', 'csv')
+        if output not in ('csv', 'json'):
+            return Response({'error': "'output' must be 'csv' or 'json'."}, status=400)
+
+        rows = gst.gst_summary(request.user.store, start, end, group_by)
+        if output == 'json':
+            return Response([
+                {column: gst.cell(row[column]) for column in gst.COLUMNS[group_by]}
+                for row in rows
+            ])
+        response = streaming_response(gst.csv_rows(rows.iterator(), group_by), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="gst_{group_by}.csv"'
+        return response
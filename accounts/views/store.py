@@ -0,0 +1,51 @@
+"""The user's store profile."""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..models import Store
+from ..serializers import StoreSerializer
+
+
+# ✅ Create Store View
+class StoreCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if Store.objects.filter(user_id=request.user.pk).exists():
+            return Response({"detail": "User already has a store."}, status=400)
+
+        serializer = StoreSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(user_id=request.user.pk)
+            return Response(serializer.data, status=201)
+        return Response(serializer.errors, status=400)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_user_store(request):
+    try:
+        store = Store.objects.get(user_id=request.user.pk)  # fresh, not the per-worker cached copy
+        serializer = StoreSerializer(store)
+        return Response(serializer.data)
+    except Store.DoesNotExist:
+        return Response({}, status=204)
+
+#modify store
+class StoreDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        store = Store.objects.get(user_id=request.user.pk)
+        serializer = StoreSerializer(store)
+        return Response(serializer.data)
+
+    def put(self, request):
+        store = Store.objects.get(user_id=request.user.pk)
+        serializer = StoreSerializer(store, data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()  # also drops this worker's cached copy (see store_cache)
+            return Response(serializer.data)
+        return Response(serializer.errors, status=400)
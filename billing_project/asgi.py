@@ -3,6 +3,10 @@ ASGI config for billing_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Loading it switches SERVING_MODE to 'asgi', so the read endpoints are served
+by their async versions (see accounts.async_views). ``SERVING_MODE=asgi
+gunicorn`` serves it with uvicorn workers; see gunicorn.conf.py.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +16,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'billing_project.settings')
+os.environ.setdefault('SERVING_MODE', 'asgi')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -46,9 +47,14 @@ INSTALLED_APPS = [
 'rest_framework_simplejwt',
 'corsheaders',
 ]
+# JWT_AUTH_MODE=stateless authenticates from token claims without loading
+# the User row; the default 'stateful' mode loads it on every request.
+JWT_AUTH_MODE = os.environ.get('JWT_AUTH_MODE', 'stateful')
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.StatelessStoreJWTAuthentication'
+        if JWT_AUTH_MODE == 'stateless' else
+        'accounts.authentication.StoreJWTAuthentication',
     ),
 }
 SIMPLE_JWT = {
@@ -58,7 +64,11 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.StoreTokenObtainPairSerializer',
+    'TOKEN_USER_CLASS': 'accounts.authentication.StoreTokenUser',
 }
+# How long a worker trusts its cached copy of a user's token_version.
+TOKEN_VERSION_CACHE_TTL = int(os.environ.get('TOKEN_VERSION_CACHE_TTL', 60))
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -70,6 +80,22 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 'corsheaders.middleware.CorsMiddleware',
 ]
+# Per-request timings in a Server-Timing header and Prometheus metrics at
+# /metrics, for clients in METRICS_ALLOWED_IPS; see accounts.instrumentation.
+# A request that runs one statement INSTRUMENTATION_N_PLUS_ONE times or more
+# is logged as a likely N+1. METRICS_DIR is a directory the workers of one
+# server share so /metrics adds them all up (gunicorn.conf.py makes one);
+# without it each worker reports only its own requests.
+# On by default. It wraps every request, adds an execute wrapper to every
+# database connection and patches DRF's BaseSerializer.data to time
+# serialization. bench_instrumentation measures what that costs: about 0.1%
+# of request time when it went in. INSTRUMENTATION=0 turns all of it off.
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION', '1') not in ('0', 'false')
+INSTRUMENTATION_N_PLUS_ONE = int(os.environ.get('INSTRUMENTATION_N_PLUS_ONE', 10))
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+if INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'accounts.instrumentation.InstrumentationMiddleware')
 
 ROOT_URLCONF = 'billing_project.urls'
 
@@ -89,13 +115,79 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'billing_project.wsgi.application'
+# 'wsgi' or 'asgi'. billing_project/asgi.py defaults it to 'asgi', which
+# serves the read endpoints from accounts.async_views.
+SERVING_MODE = os.environ.get('SERVING_MODE', 'wsgi')
 BASE_DIR = Path(__file__).resolve().parent.parent
+# Database profile, picked by DATABASE_URL:
+#
+# - SQLite (the default; single-store installs). WAL journal, so reads go on
+#   while a checkout writes; writers queue for the write lock for up to
+#   SQLITE_BUSY_TIMEOUT seconds. synchronous stays FULL: an invoice the till
+#   was told about survives a power cut. SQLITE_WAL=0 keeps the rollback
+#   journal, where a write also blocks every read.
+# - PostgreSQL. DB_POOL picks how connections are shared:
+#   'psycopg' (default): a psycopg_pool per worker process, DB_POOL_MIN_SIZE
+#   to DB_POOL_MAX_SIZE connections, a request waits up to DB_POOL_TIMEOUT
+#   seconds for a free one. Size it to the threads (or, under ASGI, the
+#   requests in flight) of one worker.
+#   'pgbouncer': DATABASE_URL points at PgBouncer in transaction pooling
+#   mode. Server-side cursors and session settings don't survive across
+#   transactions there, so the former are off and the timeouts below have
+#   to be set on the role instead (ALTER ROLE ... SET statement_timeout).
+#   'off': one persistent connection per thread.
+#   DB_STATEMENT_TIMEOUT_MS (default 25s, under gunicorn's 30s timeout) and
+#   DB_IDLE_IN_TRANSACTION_TIMEOUT_MS cancel runaway queries and release the
+#   locks of abandoned transactions; set 0 for long maintenance commands.
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///' + str(BASE_DIR / 'db.sqlite3'),
-        conn_max_age=600
+        # Under ASGI every request runs its ORM calls on a thread of its own,
+        # so a persistent connection would be left behind per request.
+        conn_max_age=0 if SERVING_MODE == 'asgi' else 600,
+        # Ping a persistent connection before reusing it for a new request.
+        conn_health_checks=True,
     )
 }
+DB_POOL = os.environ.get('DB_POOL', 'psycopg')
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    options = DATABASES['default'].setdefault('OPTIONS', {})
+    # SQLite has no row locks: take the write lock at BEGIN so concurrent
+    # checkouts queue on the busy timeout instead of deadlocking on upgrade.
+    options['transaction_mode'] = 'IMMEDIATE'
+    options['timeout'] = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20))
+    if os.environ.get('SQLITE_WAL', '1') not in ('0', 'false'):
+        options['init_command'] = 'PRAGMA journal_mode=WAL'
+    # Covering indexes' INCLUDE columns only exist on Postgres; SQLite builds
+    # the same index on its key columns alone.
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
+    # Threaded checkout tests need real file locking; the default shared-cache
+    # in-memory test database fails fast with "table is locked". Kept out of
+    # the checkout so the file and its -wal/-shm siblings never get committed.
+    DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(tempfile.gettempdir(), 'billing_project_test.sqlite3'),
+    }
+elif DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    options = DATABASES['default'].setdefault('OPTIONS', {})
+    options.setdefault('connect_timeout', int(os.environ.get('DB_CONNECT_TIMEOUT', 5)))
+    if DB_POOL == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    else:
+        options['options'] = (
+            f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 25000))} "
+            f"-c idle_in_transaction_session_timeout={int(os.environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))}"
+        )
+    if DB_POOL == 'psycopg':
+        from psycopg_pool import ConnectionPool
+
+        # Pooled connections go back to the pool at the end of each request.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        options['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'check': ConnectionPool.check_connection,
+        }
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.postgresql',
@@ -107,6 +199,50 @@ DATABASES = {
 #     }
 # }
 
+# Per-worker LRU of each user's Store, consulted on every authenticated request.
+STORE_CACHE_SIZE = int(os.environ.get('STORE_CACHE_SIZE', 1024))
+STORE_CACHE_TTL = int(os.environ.get('STORE_CACHE_TTL', 300))
+
+# Serialized product catalogs kept per worker, and how long the catalog
+# version may be served from CACHES (0 = always read it from the database;
+# only raise it with a cache backend shared by all workers).
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 256))
+CATALOG_VERSION_CACHE_TTL = int(os.environ.get('CATALOG_VERSION_CACHE_TTL', 0))
+# Per-worker LRU of (store, SKU) -> product id for scanned barcodes.
+SKU_CACHE_SIZE = int(os.environ.get('SKU_CACHE_SIZE', 10000))
+SKU_CACHE_TTL = int(os.environ.get('SKU_CACHE_TTL', 300))
+
+# Rendered invoice PDFs, stored by a hash of their HTML, and the size of the
+# per-process pool that renders cache misses.
+INVOICE_PDF_CACHE_DIR = os.environ.get('INVOICE_PDF_CACHE_DIR', str(BASE_DIR / 'pdf_cache'))
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 2))
+# Under ASGI the PDF endpoint waits this long for a render to finish before
+# answering 202; waiting costs no worker there.
+PDF_RENDER_WAIT_SECONDS = float(os.environ.get('PDF_RENDER_WAIT_SECONDS', 10))
+# Extra CSS files applied to every invoice PDF; parsed once per render worker.
+INVOICE_PDF_STYLESHEETS = []
+# Largest batch the zip endpoint accepts; use the export_invoice_pdfs
+# command for anything bigger.
+INVOICE_PDF_BATCH_LIMIT = 500
+# Offline-till uploads: most invoices accepted per request, and how many of
+# them are written per transaction.
+INVOICE_BULK_LIMIT = 1000
+INVOICE_BULK_GROUP_SIZE = 50
+# Server-sent low-stock alerts: how often an open stream checks for new
+# alerts, and how long it stays open before the client has to reconnect.
+STOCK_ALERT_POLL_SECONDS = float(os.environ.get('STOCK_ALERT_POLL_SECONDS', 2))
+STOCK_ALERT_STREAM_SECONDS = int(os.environ.get('STOCK_ALERT_STREAM_SECONDS', 55))
+# Under WSGI an open stream holds one of the worker's GUNICORN_THREADS
+# threads (and its database connection) for its whole life; past this many
+# per process a stream sends what's new and ends, and the client polls on
+# reconnect. The default leaves three quarters of the threads for checkout
+# and other requests; raise it with the thread count, never to match it, or
+# open streams can take every thread. Under ASGI streams wait on the event
+# loop and aren't capped.
+STOCK_ALERT_MAX_STREAMS = int(os.environ.get(
+    'STOCK_ALERT_MAX_STREAMS', max(1, int(os.environ.get('GUNICORN_THREADS', 4)) // 4),
+))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
@@ -23,4 +24,9 @@ urlpatterns = [
 
     # 👇 this is your auth/store endpoints
     path('api/auth/', include('accounts.urls')),
-]
\ No newline at end of file
+]
+
+if settings.INSTRUMENTATION:
+    from accounts.instrumentation import metrics_view
+
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
@@ -0,0 +1,127 @@
+"""gunicorn settings, read from the environment.
+
+gunicorn loads this file from the working directory on its own, so the
+Procfile only has to run ``gunicorn``.
+
+- SERVING_MODE: 'wsgi' (default) or 'asgi'; picks the application and
+  the worker class (uvicorn workers for 'asgi').
+- WEB_CONCURRENCY: worker processes. Defaults to 2 per core plus 1 for
+  WSGI and 1 per core for ASGI, where a worker already overlaps requests.
+- GUNICORN_THREADS: threads per WSGI worker (default 4). More than 1
+  switches to the gthread worker, which overlaps database waits inside a
+  process instead of paying a whole process per concurrent request.
+  Open stock-alert streams may hold a quarter of them by default (see
+  STOCK_ALERT_MAX_STREAMS in settings).
+- GUNICORN_PRELOAD: load Django and every view once in the master
+  (default on). Workers fork with it already imported and share those
+  pages copy-on-write. Without it a worker imports views as they're hit.
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: recycle a worker
+  after this many requests (default 1000, +0..100) to bound memory
+  growth. The jitter keeps workers from restarting all at once.
+- GUNICORN_TIMEOUT, GUNICORN_KEEPALIVE: seconds.
+- STATSD_HOST (host:port): send gunicorn's request, status and worker
+  metrics to statsd, plus each worker's resident memory.
+- METRICS_DIR: where workers leave their request metrics for /metrics to
+  add up (see accounts.instrumentation); the master folds an exited
+  worker's file into one total. Defaults to a fresh directory per server
+  start, removed on shutdown.
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+
+serving_mode = os.environ.get('SERVING_MODE', 'wsgi')
+cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+wsgi_app = f'billing_project.{serving_mode}:application'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if serving_mode == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores))
+else:
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+    worker_class = 'gthread' if threads > 1 else 'sync'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') not in ('0', 'false')
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Heartbeat files in memory, not on a disk that may stall under load.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Set before the app is loaded, so settings (and every worker) see it.
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(
+        prefix='billing-metrics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None,
+    )
+    _own_metrics_dir = os.environ['METRICS_DIR']
+
+statsd_host = os.environ.get('STATSD_HOST')
+statsd_prefix = os.environ.get('STATSD_PREFIX', 'billing')
+
+# How often (in requests) a WSGI worker reports its resident memory.
+RSS_REPORT_INTERVAL = 100
+
+
+def rss_kib(pid='self'):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def when_ready(server):
+    # Views are imported on their first request (see accounts.views). With
+    # the app preloaded, import them all here instead, so workers fork with
+    # them shared rather than each importing its own copy.
+    if server.cfg.preload_app:
+        from django.urls import get_resolver
+
+        from accounts.views import load_views
+
+        load_views(get_resolver())
+
+
+def pre_fork(server, worker):
+    # Move everything the preloaded app allocated out of the collector's
+    # reach: a collection in a worker would otherwise touch, and so copy,
+    # every shared page.
+    gc.freeze()
+
+
+def post_request(worker, req, environ, resp):
+    # Only sync and gthread workers call this hook.
+    if worker.nr % RSS_REPORT_INTERVAL == 0 and hasattr(worker.log, 'histogram'):
+        worker.log.histogram('gunicorn.worker.rss_kib', rss_kib())
+
+
+def worker_exit(server, worker):
+    # The last few seconds of this worker's metrics, before it goes.
+    if os.environ.get('METRICS_DIR') and 'accounts.instrumentation' in sys.modules:
+        sys.modules['accounts.instrumentation'].registry.flush(os.environ['METRICS_DIR'])
+    server.log.info(
+        'Worker %s exiting after %s requests, RSS %d MiB',
+        worker.pid, getattr(worker, 'nr', '?'), rss_kib() // 1024,
+    )
+
+
+def child_exit(server, worker):
+    # In the master, once a worker is gone (recycled, timed out or crashed):
+    # fold its metrics into the exited-workers total, so METRICS_DIR keeps
+    # one file per live worker and /metrics stays as cheap as it started.
+    if os.environ.get('METRICS_DIR'):
+        from accounts.instrumentation import fold_exited
+
+        fold_exited(os.environ['METRICS_DIR'], worker.pid)
+
+
+def on_exit(server):
+    if '_own_metrics_dir' in globals():
+        shutil.rmtree(_own_metrics_dir, ignore_errors=True)